@@ -0,0 +1,169 @@
+import os
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from hashlib import sha256
+from threading import Lock
+from typing import Generator, IO
+
+# Local caches (Drive content, worksheet summaries) live under one directory that can be moved with CLOUD_AI_CACHE_DIR
+CACHE_DIR = os.environ.get('CLOUD_AI_CACHE_DIR', os.path.expanduser('~/.cache/cloud-ai'))
+
+
+class _CacheIndex():
+    # In-memory sizes of the entries in one cache directory, least recently used first.
+    # Shared by every ContentCache on the same directory, and loaded from disk once per process.
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = Lock()
+        self._entries: OrderedDict[str, int] = None
+        self.total = 0
+
+    @property
+    def entries(self) -> OrderedDict[str, int]:
+        if self._entries is None:
+            found = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith('.tmp'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    found.append((stat.st_mtime, path, stat.st_size))
+            self._entries = OrderedDict((path, size) for _, path, size in sorted(found))
+            self.total = sum(self._entries.values())
+        return self._entries
+
+    def touch(self, path: str, size: int):
+        entries = self.entries
+        self.total += size - entries.get(path, 0)
+        entries[path] = size
+        entries.move_to_end(path)
+
+    def discard(self, path: str):
+        self.total -= self.entries.pop(path, 0)
+
+
+_indexes: dict[str, _CacheIndex] = {}
+_indexes_lock = Lock()
+
+
+class ContentCache():
+    """
+    A size-bounded, content-addressed file cache on local disk.
+
+    Entries are keyed by (file id, content validator, export mime type). The validator is the Drive md5Checksum for
+    binary files or the version for Google Docs/Sheets/Slides, so a changed file simply misses the cache. When the
+    cache grows past `max_bytes`, the least recently used entries are removed; an entry larger than `max_bytes` is
+    not kept at all. Sizes and recency are tracked in memory, so reads and writes never rescan the directory.
+    """
+    def __init__(self, directory: str = None, max_bytes: int = None):
+        self.directory = directory or os.path.join(CACHE_DIR, 'drive_content')
+        self.max_bytes = max_bytes or int(os.environ.get('CLOUD_AI_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+        with _indexes_lock:
+            self._index = _indexes.setdefault(os.path.abspath(self.directory), _CacheIndex(self.directory))
+
+    @staticmethod
+    def key(file_id: str, validator: str, mime_type: str = None) -> str:
+        return sha256(f'{file_id}|{validator}|{mime_type or ""}'.encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def fits(self, size: int) -> bool:
+        return size <= self.max_bytes
+
+    def get(self, key: str) -> str:
+        """
+        Gets the path of a cached entry and marks it as recently used
+
+        Returns:
+            str: the path of the cached file, or None on a miss
+        """
+        path = self.path(key)
+        with self._index.lock:
+            try:
+                os.utime(path)
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                self._index.discard(path)
+                return None
+            self._index.touch(path, size)
+        return path
+
+    @contextmanager
+    def writer(self, key: str) -> Generator[IO[bytes], None, None]:
+        """
+        Opens a temporary file that becomes the cache entry when the block exits without an error.
+        If it turns out larger than max_bytes it is dropped instead, and get(key) stays a miss.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                yield f
+                size = f.tell()
+            if not self.fits(size):
+                print(f'Not caching {key}: {size} bytes is more than the cache size of {self.max_bytes} bytes')
+                os.remove(temp_path)
+                return
+            with self._index.lock:
+                os.replace(temp_path, path)
+                self._index.touch(path, size)
+                self._evict(keep=path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def put(self, key: str, content: bytes) -> str:
+        """
+        Stores an entry
+
+        Returns:
+            str: the path of the cached file, or None if the content is larger than max_bytes
+        """
+        with self.writer(key) as f:
+            f.write(content)
+        return self.path(key) if self.fits(len(content)) else None
+
+    def evict(self, keep: str = None):
+        """
+        Removes the least recently used entries until the cache fits in max_bytes
+
+        Args:
+            keep (str, optional): the path of an entry that must not be removed, e.g. the one just written
+        """
+        with self._index.lock:
+            self._evict(keep)
+
+    def _evict(self, keep: str = None):
+        entries = self._index.entries
+        for path in list(entries):
+            if self._index.total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._index.discard(path)
+
+    def clear(self):
+        # Temporary files belong to writers that are still running, so they are left alone
+        with self._index.lock:
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith('.tmp'):
+                        continue
+                    try:
+                        os.remove(os.path.join(root, name))
+                    except FileNotFoundError:
+                        pass
+            self._index.entries.clear()
+            self._index.total = 0
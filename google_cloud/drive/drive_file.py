@@ -1,10 +1,11 @@
-from googleapiclient.discovery import Resource, build
+from googleapiclient.discovery import Resource
 from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 import io
-from pymediainfo import MediaInfo
 from google.oauth2.service_account import Credentials
 from googleapiclient.errors import HttpError
 from google.genai import Client, types
+from .service_registry import service_registry
+from .media_probe import probe_resolution
 
 class GoogleDriveFile:
     def __init__(self, credentials:Credentials, drive: Resource, **kwargs):
@@ -27,20 +28,20 @@ class GoogleDriveFile:
     @property
     def slides_client(self) -> Resource:
         if not self._slides_client:
-            self._slides_client = build('slides', 'v1', credentials=self.crendentials)
+            self._slides_client = service_registry.service('slides', 'v1', self.crendentials)
         return self._slides_client
     
     @property
     def docs_client(self) -> Resource:
         if not self._docs_client:
-            self._docs_client = build('docs', 'v1', credentials=self.crendentials)
+            self._docs_client = service_registry.service('docs', 'v1', self.crendentials)
         return self._docs_client
 
     
     @property
     def sheets_client(self) -> Resource: 
         if not self._sheets_client:
-            self._sheets_client = build('sheets', 'v4', credentials=self.crendentials)
+            self._sheets_client = service_registry.service('sheets', 'v4', self.crendentials)
         return self._sheets_client
     
     @classmethod
@@ -150,13 +151,23 @@ class GoogleDriveFile:
     def resolution(self) -> tuple[int, int]:
         if not self._resolution:
             try:
-                # Parse the media information from the stream
-                media_info = MediaInfo.parse(self.file)
-
-                # Find the video track and get the resolution
-                for track in media_info.video_tracks:
-                    if track.width and track.height:
-                        self._resolution = (track.width, track.height)
+                # Drive's own metadata first, then only the container metadata instead of the whole file
+                metadata = self.drive.files().get(fileId=self.id, fields='size, videoMediaMetadata(width, height)').execute()
+                video = metadata.get('videoMediaMetadata') or {}
+                if video.get('width') and video.get('height'):
+                    self._resolution = (video['width'], video['height'])
+                else:
+                    session = service_registry.session(self.crendentials)
+
+                    def read_range(start: int, end: int) -> bytes:
+                        response = session.get(
+                            f'https://www.googleapis.com/drive/v3/files/{self.id}', params={'alt': 'media'},
+                            headers={'Range': f'bytes={start}-{end}'}, timeout=(30, 300)
+                        )
+                        response.raise_for_status()
+                        return response.content[:end - start + 1]
+
+                    self._resolution = probe_resolution(read_range, int(metadata.get('size') or 0))
 
             except Exception as e:
                 print(f"An error occurred: {e}")
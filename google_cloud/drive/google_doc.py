@@ -1,16 +1,599 @@
 from googleapiclient.discovery import build, Resource
 from google_cloud import GoogleCloudService
-import mistune
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 import io
+import re
+from bisect import bisect_right
+from copy import deepcopy
+from time import monotonic
 from googleapiclient.errors import HttpError
 from .google_drive_service import GoogleDriveFile
+from .markdown_requests import markdown_to_requests, inserted_length
 
 class IndexRange:
     def __init__(self, start: int, end: int=None):
         self.start = start
         self.end = end
-    
+
+    def __repr__(self):
+        return f'IndexRange(start={self.start}, end={self.end})'
+
+
+class DocumentIndex:
+    """
+    Text, insert markers and a paragraph index of a Google Doc, built in a single walk over its structure.
+
+    The walk covers the body, tables (including lists and tables nested in cells), tables of contents, headers,
+    footers and footnotes. `text` is assembled once from the collected runs, in the order headers, body, footers,
+    footnotes. Each paragraph records its segment and segment ID (None for the body), its document indices and its
+    offset in `text`.
+    """
+    MARKERS = {'$$$START_INSERT$$$': 'start', '$$$END_INSERT$$$': 'end'}
+
+    def __init__(self, document: dict):
+        self.revision_id: str = document.get('revisionId')
+        self.paragraphs: list[dict] = []
+        self.markers: dict[str, IndexRange] = {}
+
+        segments = [('headers', segment_id, segment) for segment_id, segment in (document.get('headers') or {}).items()]
+        segments.append(('body', None, document.get('body') or {}))
+        segments += [('footers', segment_id, segment) for segment_id, segment in (document.get('footers') or {}).items()]
+        segments += [('footnotes', segment_id, segment) for segment_id, segment in (document.get('footnotes') or {}).items()]
+
+        parts = []
+        offset = 0
+        for kind, segment_id, segment in segments:
+            # Depth-first over the structural elements, in document order
+            stack = [iter(segment.get('content') or [])]
+            while stack:
+                element = next(stack[-1], None)
+                if element is None:
+                    stack.pop()
+                    continue
+
+                if 'paragraph' in element:
+                    paragraph = element['paragraph']
+                    runs = []
+                    for run in paragraph.get('elements') or []:
+                        content = (run.get('textRun') or {}).get('content')
+                        if content is None:
+                            continue
+                        runs.append(content)
+                        marker = self.MARKERS.get(content.strip())
+                        if marker and segment_id is None:
+                            self.markers[marker] = IndexRange(start=run.get('startIndex'), end=run.get('endIndex'))
+                    paragraph_text = ''.join(runs)
+                    self.paragraphs.append({
+                        'segment': kind,
+                        'segment_id': segment_id,
+                        'start_index': element.get('startIndex', 0),
+                        'end_index': element.get('endIndex'),
+                        'offset': offset,
+                        'text': paragraph_text,
+                        'style': (paragraph.get('paragraphStyle') or {}).get('namedStyleType'),
+                        'bullet': paragraph.get('bullet'),
+                    })
+                    parts.append(paragraph_text)
+                    offset += len(paragraph_text)
+                elif 'table' in element:
+                    cells = (
+                        cell.get('content') or []
+                        for row in element['table'].get('tableRows') or []
+                        for cell in row.get('tableCells') or []
+                    )
+                    stack.append((content for cell_content in cells for content in cell_content))
+                elif 'tableOfContents' in element:
+                    stack.append(iter(element['tableOfContents'].get('content') or []))
+
+        self.text: str = ''.join(parts)
+        self._body_starts = [paragraph['start_index'] for paragraph in self.paragraphs if paragraph['segment_id'] is None]
+        self._body_paragraphs = [paragraph for paragraph in self.paragraphs if paragraph['segment_id'] is None]
+
+    def paragraph_at(self, index: int) -> dict:
+        """
+        Finds the body paragraph that contains a document index
+
+        Returns:
+            dict: the paragraph, or None if the index is outside the body
+        """
+        position = bisect_right(self._body_starts, index) - 1
+        if position < 0:
+            return None
+        paragraph = self._body_paragraphs[position]
+        return paragraph if index < paragraph['end_index'] else None
+
+def _walk_elements(content: list):
+    # Every structural element, table row/cell and paragraph element (text run, ...) below a content list
+    stack = [iter(content)]
+    while stack:
+        element = next(stack[-1], None)
+        if element is None:
+            stack.pop()
+            continue
+        yield element
+        if 'paragraph' in element:
+            yield from element['paragraph'].get('elements') or []
+        elif 'table' in element:
+            for row in element['table'].get('tableRows') or []:
+                yield row
+                for cell in row.get('tableCells') or []:
+                    yield cell
+                    stack.append(iter(cell.get('content') or []))
+        elif 'tableOfContents' in element:
+            stack.append(iter(element['tableOfContents'].get('content') or []))
+
+
+def _content_lists(content: list):
+    # The body content list and the content list of every table cell below it
+    yield content
+    for element in _walk_elements(content):
+        if 'content' in element:
+            yield element['content']
+        elif 'tableOfContents' in element:
+            yield element['tableOfContents'].setdefault('content', [])
+
+
+def _split_run(run: dict, index: int) -> list[dict]:
+    # Splits a text run in two at a document index inside it
+    start = run.get('startIndex', 0)
+    if 'textRun' not in run or not start < index < run['endIndex']:
+        return [run]
+    content = run['textRun']['content']
+    head = deepcopy(run) | {'endIndex': index}
+    tail = deepcopy(run) | {'startIndex': index}
+    head['textRun']['content'] = content[:index - start]
+    tail['textRun']['content'] = content[index - start:]
+    return [head, tail]
+
+
+def _split_paragraph(element: dict) -> list[dict]:
+    # Splits a paragraph whose text runs contain newlines before their end into one paragraph per line
+    paragraphs, runs = [], []
+    for run in element['paragraph'].get('elements') or []:
+        pieces = re.findall(r'[^\n]*\n|[^\n]+', run['textRun']['content']) if 'textRun' in run else [None]
+        position = run.get('startIndex', 0)
+        for piece in pieces:
+            if piece is None:
+                runs.append(run)
+                continue
+            piece_run = deepcopy(run) | {'startIndex': position, 'endIndex': position + len(piece)}
+            piece_run['textRun']['content'] = piece
+            runs.append(piece_run)
+            position += len(piece)
+            if piece.endswith('\n'):
+                paragraphs.append(runs)
+                runs = []
+    if runs:
+        if paragraphs:
+            paragraphs[-1] += runs
+        else:
+            paragraphs.append(runs)
+
+    if len(paragraphs) == 1:
+        element['paragraph']['elements'] = paragraphs[0]
+        return [element]
+    split = []
+    for paragraph_runs in paragraphs:
+        paragraph = deepcopy({key: value for key, value in element['paragraph'].items() if key != 'elements'})
+        paragraph['elements'] = paragraph_runs
+        split.append({
+            'startIndex': paragraph_runs[0].get('startIndex', 0),
+            'endIndex': paragraph_runs[-1]['endIndex'],
+            'paragraph': paragraph
+        })
+    return split
+
+
+def _normalize_content(content: list):
+    # Drops emptied elements, then re-splits paragraphs at newlines and merges paragraphs left without one
+    for elements in list(_content_lists(content)):
+        normalized = []
+        for element in elements:
+            if 'paragraph' in element:
+                element['paragraph']['elements'] = [
+                    run for run in element['paragraph'].get('elements') or [] if run.get('startIndex', 0) < run.get('endIndex', 0)
+                ]
+                if not element['paragraph']['elements']:
+                    continue
+                previous = normalized[-1] if normalized else None
+                if previous and 'paragraph' in previous and not _paragraph_text(previous).endswith('\n'):
+                    previous['paragraph']['elements'] += element['paragraph']['elements']
+                    previous['endIndex'] = element['endIndex']
+                    continue
+                normalized += _split_paragraph(element)
+            elif element.get('startIndex', 0) < element.get('endIndex', 1):
+                normalized.append(element)
+        elements[:] = normalized
+
+
+def _paragraph_text(element: dict) -> str:
+    return ''.join((run.get('textRun') or {}).get('content', '') for run in element['paragraph'].get('elements') or [])
+
+
+def _apply_fields(target: dict, values: dict, fields: str):
+    # Applies a field mask the way the Docs API does: listed fields missing from `values` are reset
+    if fields.strip() == '*':
+        target.clear()
+        target.update(deepcopy(values))
+        return
+    for field in fields.split(','):
+        key = field.strip().split('.')[0]
+        if key in values:
+            target[key] = deepcopy(values[key])
+        else:
+            target.pop(key, None)
+
+
+def _model_insert(content: list, index: int, text: str) -> bool:
+    # Like the Docs API, inserted text joins the run before the index (taking its style) unless it starts a paragraph
+    elements = [element for element in _walk_elements(content) if element.get('endIndex') is not None]
+    runs = [element for element in elements if 'textRun' in element]
+    target = (
+        next((run for run in runs if run.get('startIndex', 0) < index < run['endIndex']), None)
+        or next((run for run in runs if run['endIndex'] == index and not run['textRun']['content'].endswith('\n')), None)
+        or next((run for run in runs if run.get('startIndex', 0) == index), None)
+    )
+    if target is None:
+        return False
+    offset = index - target.get('startIndex', 0)
+    append = target['endIndex'] == index
+
+    for element in elements:
+        start, end = element.get('startIndex', 0), element['endIndex']
+        if start > index or (append and start == index):
+            element['startIndex'], element['endIndex'] = start + len(text), end + len(text)
+        elif end > index or element is target:
+            element['endIndex'] = end + len(text)
+
+    run = target['textRun']
+    run['content'] = run['content'][:offset] + text + run['content'][offset:]
+    if '\n' in text:
+        _normalize_content(content)
+    return True
+
+
+def _model_delete(content: list, start: int, end: int) -> bool:
+    # Table boundaries can't be modelled: deleting part of a table (or across its edge) makes the model stale
+    for element in _walk_elements(content):
+        if 'table' in element or 'tableCellStyle' in element:
+            inside = start <= element.get('startIndex', 0) and element['endIndex'] <= end
+            outside = end <= element.get('startIndex', 0) or element['endIndex'] <= start
+            contains = element.get('startIndex', 0) < start and end < element['endIndex']
+            if not (inside or outside or contains):
+                return False
+
+    shift = lambda index: index if index <= start else (start if index < end else index - (end - start))
+    for element in _walk_elements(content):
+        element_start, element_end = element.get('startIndex', 0), element.get('endIndex')
+        if element_end is None:
+            continue
+        if 'textRun' in element:
+            text = element['textRun']['content']
+            element['textRun']['content'] = text[:max(0, start - element_start)] + text[max(0, end - element_start):]
+        if 'startIndex' in element:
+            element['startIndex'] = shift(element_start)
+        element['endIndex'] = shift(element_end)
+    _normalize_content(content)
+    return True
+
+
+def _model_text_style(content: list, start: int, end: int, style: dict, fields: str) -> bool:
+    for element in _walk_elements(content):
+        if 'paragraph' not in element or element['endIndex'] <= start or end <= element.get('startIndex', 0):
+            continue
+        runs = []
+        for run in element['paragraph'].get('elements') or []:
+            for piece in _split_run(run, start):
+                runs += _split_run(piece, end)
+        element['paragraph']['elements'] = runs
+        for run in runs:
+            if 'textRun' in run and start <= run['startIndex'] and run['endIndex'] <= end:
+                _apply_fields(run['textRun'].setdefault('textStyle', {}), style, fields)
+    return True
+
+
+def _model_paragraph_style(content: list, start: int, end: int, style: dict, fields: str) -> bool:
+    for element in _walk_elements(content):
+        if 'paragraph' in element and element.get('startIndex', 0) < max(end, start + 1) and start < element['endIndex']:
+            _apply_fields(element['paragraph'].setdefault('paragraphStyle', {}), style, fields)
+    return True
+
+
+class DocumentEditor():
+    """
+    Collects edits to a GoogleDoc and sends them as a single documents.batchUpdate.
+
+    All indices refer to the document as it was when the editor was opened. On commit, index-based edits are sent in
+    descending index order (edits at the same index in reverse, so inserted texts read in call order), and ranges are
+    stretched over text inserted inside them, so no edit shifts another. Text inserted inside a deleted range is sent
+    right after the delete, at its start, so it survives. Text replacements go last. If the document is loaded, a
+    batch() session's request carries writeControl.requiredRevisionId, so it fails instead of editing the wrong place
+    when someone else changed the document, and the edits are applied to the loaded document instead of refetching it.
+    One-off edits (write_control=False) are sent without it, like plain batchUpdates. Nothing is sent if the block raises.
+
+    Usage:
+        with google_doc.batch() as editor:
+            editor.insert_text('Title\\n', 1)
+            editor.update_paragraph_style(1, 7, {'namedStyleType': 'HEADING_1'})
+            editor.replace_all_text('2024', '{{year}}')
+    """
+    def __init__(self, google_doc: 'GoogleDoc', write_control: bool = True):
+        self.google_doc = google_doc
+        self.write_control = write_control
+        self._edits: list[dict] = []
+        self._replacements: list[dict] = []
+        self.result: dict = None
+
+    def __enter__(self) -> 'DocumentEditor':
+        self.google_doc._editor = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.google_doc._editor = None
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def _add(self, kind: str, start: int, end: int, segment_id: str, **fields):
+        self._edits.append({'kind': kind, 'start': start, 'end': end, 'segment_id': segment_id, 'sequence': len(self._edits)} | fields)
+
+    def insert_text(self, text: str, index: int, segment_id: str = None):
+        self._add('insertText', index, index, segment_id, text=text)
+
+    def delete_range(self, start_index: int, end_index: int, segment_id: str = None):
+        self._add('deleteContentRange', start_index, end_index, segment_id)
+
+    def update_text_style(self, start_index: int, end_index: int, text_style: dict, fields: str = None, segment_id: str = None):
+        self._add('updateTextStyle', start_index, end_index, segment_id, style=text_style, fields=fields or ','.join(text_style))
+
+    def update_paragraph_style(self, start_index: int, end_index: int, paragraph_style: dict, fields: str = None, segment_id: str = None):
+        self._add('updateParagraphStyle', start_index, end_index, segment_id, style=paragraph_style, fields=fields or ','.join(paragraph_style))
+
+    def replace_all_text(self, replace_text: str, contains_text: str, match_case: bool = True, search_by_regex: bool = False):
+        self._replacements.append({
+            'replaceAllText': {
+                'replaceText': replace_text,
+                'containsText': {'text': contains_text, 'matchCase': match_case, 'searchByRegex': search_by_regex}
+            }
+        })
+
+    @property
+    def edits(self) -> list[dict]:
+        """
+        The index-based edits in the order they are sent, with indices relative to the document at that point
+        """
+        deletes = [edit for edit in self._edits if edit['kind'] == 'deleteContentRange']
+        # Inserts strictly inside a deleted range would be stretched over and deleted, so they follow their delete
+        containing: dict[int, dict] = {}
+        for edit in self._edits:
+            if edit['kind'] == 'insertText':
+                for delete in deletes:
+                    if delete['segment_id'] == edit['segment_id'] and delete['start'] < edit['start'] < delete['end']:
+                        containing[edit['sequence']] = delete
+                        break
+
+        def order(edit: dict) -> tuple:
+            delete = containing.get(edit['sequence'])
+            if delete:
+                return (edit['segment_id'] or '', -delete['start'], -delete['sequence'], 1, -edit['start'], -edit['sequence'])
+            return (edit['segment_id'] or '', -edit['start'], -edit['sequence'], 0, 0, 0)
+
+        sent: dict[str, list[tuple[int, int, int]]] = {}
+        delete_starts: dict[int, int] = {}
+        edits = []
+        for edit in sorted(self._edits, key=order):
+            start, end = edit['start'], edit['end']
+            delete = containing.get(edit['sequence'])
+            if delete:
+                # Goes where the deleted text was, i.e. at the delete's start as it was sent
+                start = end = delete_starts[delete['sequence']]
+                sent.setdefault(edit['segment_id'], []).append((delete['start'], delete['start'], len(edit['text'])))
+                edits.append(edit | {'start': start, 'end': end})
+                continue
+            if edit['kind'] != 'insertText':
+                # Ranges cover the text they covered when the editor was opened
+                for position, position_end, delta in sent.get(edit['segment_id'], []):
+                    if not edit['start'] <= position < edit['end']:
+                        continue
+                    if delta < 0 and position_end > edit['end']:
+                        raise ValueError(f'Overlapping ranges {edit["start"]}-{edit["end"]} and {position}-{position_end}')
+                    if position == start and delta > 0:
+                        start += delta
+                    end += delta
+            sent.setdefault(edit['segment_id'], []).append(
+                (edit['start'], edit['end'], len(edit['text']) if edit['kind'] == 'insertText' else -(edit['end'] - edit['start']) if edit['kind'] == 'deleteContentRange' else 0)
+            )
+            if edit['kind'] == 'deleteContentRange':
+                delete_starts[edit['sequence']] = start
+            edits.append(edit | {'start': start, 'end': end})
+        return edits
+
+    @staticmethod
+    def _request(edit: dict) -> dict:
+        segment = {'segmentId': edit['segment_id']} if edit['segment_id'] else {}
+        if edit['kind'] == 'insertText':
+            return {'insertText': {'location': {'index': edit['start']} | segment, 'text': edit['text']}}
+        request = {'range': {'startIndex': edit['start'], 'endIndex': edit['end']} | segment}
+        if edit['kind'] == 'updateTextStyle':
+            request |= {'textStyle': edit['style'], 'fields': edit['fields']}
+        elif edit['kind'] == 'updateParagraphStyle':
+            request |= {'paragraphStyle': edit['style'], 'fields': edit['fields']}
+        return {edit['kind']: request}
+
+    @property
+    def requests(self) -> list[dict]:
+        return [self._request(edit) for edit in self.edits] + self._replacements
+
+    def _apply(self, document: dict, edit: dict) -> bool:
+        # Applies one edit to the loaded document. Returns False when it can't be modelled.
+        if edit['segment_id']:
+            return False
+        content = (document.get('body') or {}).get('content')
+        if content is None:
+            return False
+        if edit['kind'] == 'insertText':
+            return _model_insert(content, edit['start'], edit['text'])
+        if edit['kind'] == 'deleteContentRange':
+            return _model_delete(content, edit['start'], edit['end'])
+        if edit['kind'] == 'updateTextStyle':
+            return _model_text_style(content, edit['start'], edit['end'], edit['style'], edit['fields'])
+        return _model_paragraph_style(content, edit['start'], edit['end'], edit['style'], edit['fields'])
+
+    def commit(self) -> dict:
+        """
+        Sends the collected edits as one batchUpdate and updates the loaded document
+
+        Returns:
+            dict: the batchUpdate response, or None if there was nothing to send
+        """
+        edits = self.edits
+        requests = [self._request(edit) for edit in edits] + self._replacements
+        if not requests:
+            return None
+
+        document = self.google_doc._document
+        body = {'requests': requests}
+        if self.write_control and document and document.get('revisionId') and edits:
+            body['writeControl'] = {'requiredRevisionId': document['revisionId']}
+        self.result = self.google_doc.docs.documents().batchUpdate(documentId=self.google_doc.id, body=body).execute()
+        replaced = bool(self._replacements)
+        self._edits, self._replacements = [], []
+
+        self.google_doc._markdown = None
+        self.google_doc._pdf = None
+        if document:
+            revision_id = (self.result.get('writeControl') or {}).get('requiredRevisionId')
+            if 'writeControl' in body and revision_id and not replaced and all(self._apply(document, edit) for edit in edits):
+                document['revisionId'] = revision_id
+            else:
+                # Replacements, edits outside the body and edits not pinned to the loaded revision aren't modelled,
+                # so the document is fetched again on next use
+                self.google_doc._document = None
+        return self.result
+
+
+class DocumentStreamWriter():
+    """
+    Inserts a stream of text (e.g. LLM output) into a GoogleDoc while it is being produced.
+
+    Text is buffered until it holds complete paragraphs (blank-line separated blocks outside code fences in Markdown
+    mode), then sent at most every `flush_interval` seconds as one batchUpdate at the moving write position, which
+    advances by what each flush inserted. Only the unsent tail is kept in memory; once it exceeds `max_buffer`
+    characters it is flushed regardless of the interval, up to the last newline, or all of it if it holds no newline.
+    A forced flush inside a code fence closes the fence and reopens it for the rest. The rest is flushed when the
+    writer is closed, also when the block raises, so what was produced is not lost. Markdown blocks are compiled per
+    flush, so a loose list split by a flush restarts its numbering.
+
+    Usage:
+        with google_doc.stream_writer(markdown=True) as writer:
+            for chunk in client.models.generate_content_stream(...):
+                writer.write(chunk.text)
+    """
+    def __init__(self, google_doc: 'GoogleDoc', index: int = None, markdown: bool = False, flush_interval: float = 2.0, max_buffer: int = 8192):
+        self.google_doc = google_doc
+        self.position: int = index
+        self.markdown = markdown
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: list[str] = []
+        self._buffered = 0
+        # Whether a newline arrived since the buffer was last checked for complete paragraphs
+        self._newline_pending = False
+        # The fence line a forced flush reopened at the start of the buffer, until more text follows it
+        self._reopened_fence: str = None
+        self._last_flush = monotonic()
+
+    def __enter__(self) -> 'DocumentStreamWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def write(self, text: str):
+        if not text:
+            return
+        self._buffer.append(text)
+        self._buffered += len(text)
+        self._reopened_fence = None
+        self._newline_pending = self._newline_pending or '\n' in text
+        # The interval is checked against what is buffered, so a paragraph completed earlier goes out on time
+        if self._buffered > self.max_buffer or (self._newline_pending and monotonic() - self._last_flush >= self.flush_interval):
+            self.flush(force=self._buffered > self.max_buffer)
+
+    def _cut(self, text: str) -> int:
+        # The length of the leading complete paragraphs (Markdown: complete blocks outside code fences)
+        if not self.markdown:
+            return text.rfind('\n') + 1
+        cut, fenced, position = 0, False, 0
+        for line in text.splitlines(keepends=True):
+            position += len(line)
+            if line.lstrip().startswith(('```', '~~~')):
+                fenced = not fenced
+            elif not line.strip() and not fenced and line.endswith('\n'):
+                cut = position
+        return cut
+
+    @staticmethod
+    def _open_fence(text: str) -> str:
+        # The opening line of the code fence that `text` ends inside, or None
+        fence = None
+        for line in text.splitlines(keepends=True):
+            if line.lstrip().startswith(('```', '~~~')):
+                fence = None if fence else line
+        return fence
+
+    def flush(self, force: bool = False, final: bool = False):
+        """
+        Sends the complete paragraphs in the buffer. With `force`, at least up to the last newline (or the whole buffer
+        if it has none); with `final`, everything.
+        """
+        text = ''.join(self._buffer)
+        if final and text == self._reopened_fence:
+            # Nothing followed the fence a forced flush reopened, so there is no code block left to send
+            text = ''
+        if final:
+            cut = len(text)
+        else:
+            cut = self._cut(text) or ((text.rfind('\n') + 1 or len(text)) if force else 0)
+        # Don't rescan until another newline arrives
+        self._newline_pending = False
+        if not cut:
+            self._buffer, self._buffered = ([text], len(text)) if text else ([], 0)
+            return
+
+        chunk, rest = text[:cut], text[cut:]
+        fence = self._open_fence(chunk) if self.markdown and not final else None
+        if fence and chunk.endswith(fence) and rest:
+            # Don't send an empty code block: take the code line that follows the fence along with it
+            chunk, rest = text, ''
+        if fence:
+            # Each flush is compiled on its own, so a cut inside a code block closes it here and reopens it for the rest
+            marker = re.match(r'`{3,}|~{3,}', fence.lstrip()).group()
+            chunk += ('' if chunk.endswith('\n') else '\n') + marker + '\n'
+            fence = fence if fence.endswith('\n') else fence + '\n'
+            rest = fence + rest
+
+        requests = []
+        if self.position is None:
+            self.position, requests = self.google_doc._append_position()
+        if self.markdown:
+            compiled = markdown_to_requests(chunk, index=self.position)
+            length = inserted_length(compiled)
+        else:
+            compiled = [{'insertText': {'location': {'index': self.position}, 'text': chunk}}]
+            length = len(chunk)
+        if compiled:
+            self.google_doc._batch_update(requests + compiled)
+            self.position += length
+
+        self._buffer = [rest] if rest else []
+        self._buffered = len(rest)
+        self._reopened_fence = fence if fence and rest == fence else None
+        self._last_flush = monotonic()
+
+    def close(self):
+        self.flush(final=True)
+
 
 class GoogleDoc():
     def __init__(self, drive_file: GoogleDriveFile, **kwargs):
@@ -20,6 +603,9 @@ class GoogleDoc():
         self._document: Resource = None
         self._pdf: io.BytesIO = None
         self._markdown: str = None
+        self._index: DocumentIndex = None
+        self._index_document: dict = None
+        self._editor: DocumentEditor = None
     
     @property
     def id(self):
@@ -60,31 +646,26 @@ class GoogleDoc():
         self._document = self.docs.documents().get(documentId=self.drive_file.id).execute()
     
     @property
-    def text(self):
-        content = self.document.get('body').get('content')
-        doc_text = ''
-        for value in content:
-            if 'paragraph' in value:
-                elements = value.get('paragraph').get('elements')
-                for elem in elements:
-                    if 'textRun' in elem:
-                        doc_text += elem.get('textRun').get('content')
-
-        return doc_text
+    def index(self) -> DocumentIndex:
+        # Rebuilt only when the document has a new revision (or, without a revisionId, when it was fetched again)
+        revision_id = self.document.get('revisionId')
+        if self._index is None or self._index.revision_id != revision_id or (revision_id is None and self._index_document is not self._document):
+            self._index = DocumentIndex(self.document)
+            self._index_document = self._document
+        return self._index
+
+    @property
+    def text(self) -> str:
+        return self.index.text
+
+    @property
+    def paragraphs(self) -> list[dict]:
+        return self.index.paragraphs
 
     @property
     def pdf(self) -> io.BytesIO:
         if not self._pdf:
-            request = self.drive_file.google_workspace_service.drive.files().export_media(fileId=self.id, mimeType='application/pdf')
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-                print("Download %d%%." % int(status.progress() * 100))
-            
-            fh.seek(0)
-            self._pdf = fh
+            self._pdf = self.drive_file.google_workspace_service.download_file(self.id, mime_type='application/pdf', use_cache=True)
         self._pdf.seek(0)
         return self._pdf
     
@@ -92,54 +673,117 @@ class GoogleDoc():
     @property
     def markdown(self):
         if not self._markdown:
-            request = self.drive_file.google_workspace_service.drive.files().export_media(
-                fileId=self.id, mimeType="text/markdown"
-            )
-            markdown_content = request.execute()
+            markdown_content = self.drive_file.google_workspace_service.download_file(self.id, mime_type="text/markdown", use_cache=True)
 
-            self._markdown = markdown_content.decode("utf-8")
+            self._markdown = markdown_content.getvalue().decode("utf-8")
         return self._markdown
 
 
     @classmethod 
-    def new_from_markdown(cls, credentials, drive: Resource, title:str, markdown: str, email_address: str):
-        # Convert To HTMO
-        html_content = mistune.html(markdown)
-  
-        # Create a new Google Doc
-        file_metadata = {"name": title, "mimeType": "application/vnd.google-apps.document",}
+    def new_from_markdown(cls, google_workspace_service, title:str, markdown: str, email_address: str = None):
+        """
+        Creates a Google Doc from Markdown, written with Docs API requests instead of an HTML import.
 
-        media = MediaIoBaseUpload(
-            io.BytesIO(html_content.encode("utf-8")),
-            mimetype="text/html",
-            resumable=True,
-        )
+        Args:
+            google_workspace_service (GoogleWorkspaceService): the service to create the document with
+            title (str): the document name
+            markdown (str): the content
+            email_address (str, optional): give this user writer access
+
+        Returns:
+            GoogleDoc: the new document
+        """
+        file_metadata = {"name": title, "mimeType": "application/vnd.google-apps.document",}
         file = (
-            drive.files()
-            .create(body=file_metadata, media_body=media, fields="id")
+            google_workspace_service.drive.files()
+            .create(body=file_metadata, fields="id, name, mimeType")
             .execute()
         )
         file_id = file.get("id")
         print(f'File ID: {file_id}')
 
-        try:
-            permission = {"type": "user", "role": "writer", "emailAddress": email_address}
-            drive.permissions().create(fileId=file_id, body=permission).execute()
-            print(f"Shared the file with {email_address}")
-        except HttpError as error:
-            print(f"An error occurred while sharing the file: {error}")
+        google_doc = cls(drive_file=GoogleDriveFile(google_workspace_service=google_workspace_service, **file))
+        # A new document is a single empty paragraph, so the Markdown goes in at index 1
+        google_doc.insert_markdown(markdown, index=1)
+
+        if email_address:
+            try:
+                permission = {"type": "user", "role": "writer", "emailAddress": email_address}
+                google_workspace_service.drive.permissions().create(fileId=file_id, body=permission).execute()
+                print(f"Shared the file with {email_address}")
+            except HttpError as error:
+                print(f"An error occurred while sharing the file: {error}")
+
+        print(google_doc.url)
+        return google_doc
+
+    def _append_position(self) -> tuple[int, list[dict]]:
+        # The index of a new paragraph at the end of the body, and the request that ends a non-empty last paragraph first
+        index = self.max_index - 1
+        body_paragraphs = [paragraph for paragraph in self.paragraphs if paragraph['segment_id'] is None]
+        if body_paragraphs and body_paragraphs[-1]['text'] != '\n':
+            return index + 1, [{'insertText': {'location': {'index': index}, 'text': '\n'}}]
+        return index, []
 
-        doc_uri = f"https://docs.google.com/document/d/{file_id}"
-        print(doc_uri)
-        return cls(drive_file=GoogleDriveFile(credentials=credentials, drive=drive, **file))
+    def stream_writer(self, index: int = None, markdown: bool = False, flush_interval: float = 2.0, max_buffer: int = 8192) -> 'DocumentStreamWriter':
+        """
+        Opens a writer that inserts streamed text as it arrives. See DocumentStreamWriter.
+        """
+        return DocumentStreamWriter(self, index=index, markdown=markdown, flush_interval=flush_interval, max_buffer=max_buffer)
+
+    def write_stream(self, stream, index: int = None, markdown: bool = False, flush_interval: float = 2.0) -> int:
+        """
+        Writes a stream into the document while it is being produced, e.g. the chunks of generate_content_stream.
+
+        Args:
+            stream: an iterable of str, or of objects with a `text` attribute such as GenerateContentResponse chunks
+            index (int, optional): where to write, at the start of a paragraph. Defaults to the end of the body.
+            markdown (bool): compile the text as Markdown (see insert_markdown) instead of inserting it verbatim
+            flush_interval (float): the minimum number of seconds between batchUpdate calls
+
+        Returns:
+            int: the index after the written content
+        """
+        with self.stream_writer(index=index, markdown=markdown, flush_interval=flush_interval) as writer:
+            for chunk in stream:
+                writer.write(chunk if isinstance(chunk, str) else getattr(chunk, 'text', None) or '')
+        return writer.position
+
+    def insert_markdown(self, markdown: str, index: int = None, segment_id: str = None) -> dict:
+        """
+        Inserts Markdown as styled Docs content (headings, lists, emphasis, links, ...) in a single batchUpdate.
+
+        Args:
+            markdown (str): the Markdown to insert
+            index (int, optional): where to insert it, at the start of a paragraph. Defaults to the end of the body.
+            segment_id (str, optional): the header, footer or footnote to insert into, or None for the body
+
+        Returns:
+            dict: The result of the batch update operation, or None if the Markdown is empty.
+        """
+        requests = []
+        if index is None:
+            index, requests = self._append_position()
+        compiled = markdown_to_requests(markdown, index=index, segment_id=segment_id)
+        if not compiled:
+            return None
+        return self._batch_update(requests + compiled)
     
     def _batch_update(self, requests: list):
-        # Execute the batch update request
+        # Execute the batch update request. Raw requests can't be modelled locally, so the cached document is dropped.
         result = self.docs.documents().batchUpdate(
             documentId=self.id,
             body={'requests': requests}
         ).execute()
+        self.refresh_doc()
         return result
+
+    def batch(self) -> DocumentEditor:
+        """
+        Opens an edit session. Used as a context manager, the document's own edit methods (insert_text, update,
+        find_and_replace_text) are collected with the editor's and sent as one batchUpdate on exit. See DocumentEditor.
+        """
+        return DocumentEditor(self)
     
     
     @property
@@ -169,25 +813,16 @@ class GoogleDoc():
             search_by_regex (bool): Whether the search text is a regex. True if the find value should be treated as a regular expression. Any backslashes in the pattern should be escaped.
 
         Returns:
-            dict: The result of the batch update operation.
+            dict: The result of the batch update operation, or None when called inside batch().
 
         """
-        
-        requests = [
-            {
-                'replaceAllText': {
-                    'replaceText': replace_text,
-                    'containsText': {
-                        'text': contains_text,
-                        'matchCase': match_case,
-                        'searchByRegex': search_by_regex
-                    }
-                }
-            }
-        ]
+        editor = self._editor or DocumentEditor(self, write_control=False)
+        editor.replace_all_text(replace_text, contains_text, match_case=match_case, search_by_regex=search_by_regex)
+        if self._editor:
+            return None
 
         # Execute the batch update request
-        result = self._batch_update(requests)
+        result = editor.commit()
         print(result)
         return result
     
@@ -201,42 +836,21 @@ class GoogleDoc():
             index (int): The index at which to insert the text.
 
         Returns
-            dict: The result of the batch update operation.        
+            dict: The result of the batch update operation, or None when called inside batch().
         """
-        
-        # TODO: Turn Markdown Text into Google Docs Styles
-
-        requests = [
-            {
-                'insertText': {
-                    'location': {
-                        'index': index,  # Insert at the beginning of the document body
-                    },
-                    'text': text + '\n\n'
-                }
-            }
-        ]
-        result = self._batch_update(requests)
+        # For styled text, see insert_markdown
+        editor = self._editor or DocumentEditor(self, write_control=False)
+        editor.insert_text(text + '\n\n', index)
+        if self._editor:
+            return None
+
+        result = editor.commit()
         print(result)
         return result
     
 
     def update(self, text, index=1):
-        requests = [
-            {
-                'insertText': {
-                    'location': {
-                        'index': index,  # Insert at the beginning of the document body
-                    },
-                    'text': text + '\n\n'
-                }
-            }
-        ]
-
-        # Execute the batch update request
-        result = self.docs.documents().batchUpdate(documentId=self.id, body={'requests': requests}).execute()
-        print(result)
-        return result
+        return self.insert_text(text, index)
     
     # def update_title(self, title:str):
     #     self.document['title'] = title
@@ -245,39 +859,16 @@ class GoogleDoc():
     
     
     @property
-    def insert_indices(self):
+    def insert_indices(self) -> dict[str, IndexRange]:
         """
-        Finds the start and end indices of '$$$START_INSERT$$$' and '$$$END_INSERT$$$'
-        in the given data structure.
-
-        Args:
-            data: A list of dictionaries representing document content.
+        Finds the start and end indices of '$$$START_INSERT$$$' and '$$$END_INSERT$$$' in the document body.
 
         Returns:
-            A dictionary containing the start and end indices for both markers.
+            A dictionary containing the IndexRange of both markers, or None for a marker that is missing.
         """
-        start_marker_indices = None
-        end_marker_indices = None
-
-        for item in self.content:
-            if "paragraph" in item and "elements" in item["paragraph"]:
-                for element in item["paragraph"]["elements"]:
-                    if "textRun" in element and "content" in element["textRun"]:
-                        content = element["textRun"]["content"]
-                        if content.strip() == "$$$START_INSERT$$$":
-                            start_marker_indices = {
-                                "start": element["startIndex"],
-                                "end": element["endIndex"]
-                            }
-                        elif content.strip() == "$$$END_INSERT$$$":
-                            end_marker_indices = {
-                                "start": element["startIndex"],
-                                "end": element["endIndex"]
-                            }
-
         return {
-            "start": IndexRange(**start_marker_indices),
-            "end": IndexRange(**end_marker_indices)
+            "start": self.index.markers.get('start'),
+            "end": self.index.markers.get('end')
         }
     
     @property
@@ -289,17 +880,8 @@ class GoogleDoc():
         return self.insert_indices.get('end')
     
 
-    def download_as_pdf(self) -> io.BytesIO:
-        if self.mime_type != 'application/vnd.google-apps.document':
+    def download_as_pdf(self, destination=None) -> io.BytesIO:
+        if self.drive_file.mime_type != 'application/vnd.google-apps.document':
             raise ValueError("File is not a Google Doc.")
         
-        request = self.drive_file.google_workspace_service.drive.files().export_media(fileId=self.id, mimeType='application/pdf')
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-            print("Download %d%%." % int(status.progress() * 100))
-        
-        fh.seek(0)
-        return fh
\ No newline at end of file
+        return self.drive_file.google_workspace_service.download_file(self.id, mime_type='application/pdf', destination=destination)
\ No newline at end of file
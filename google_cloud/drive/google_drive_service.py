@@ -1,18 +1,87 @@
 from google_cloud import GoogleCloudService
 from google.auth.transport.requests import Request
-from google.oauth2 import service_account
-from googleapiclient.discovery import build, Resource
+from googleapiclient.discovery import Resource
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from googleapiclient.http import HttpRequest
+import asyncio
 import io
+import mimetypes
 import os
 import json
-from typing import Generator
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext, ExitStack
+from google_auth_httplib2 import AuthorizedHttp
+from google.auth.transport.requests import AuthorizedSession
+import mmap
+import requests
+import urllib3
+from random import random
+from time import sleep, monotonic
+from typing import Callable, Generator
 from pymediainfo import MediaInfo
+from .content_cache import ContentCache
+from .service_registry import service_registry
+from .resumable_upload import ResumableUpload
+from .media_probe import probe_resolution
 from datetime import datetime, UTC
+from uuid import uuid4
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+DRIVE_FILES_URL = 'https://www.googleapis.com/drive/v3/files'
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_PART_SIZE = 32 * 1024 * 1024
+
+
+# os.pwrite does not exist on Windows, where a seek and write are made atomic with this lock instead
+_seek_write_lock = threading.Lock()
+
+
+def _write_at(fd: int, data, position: int):
+    # Writes all of `data` at `position` in a file descriptor, looping over short writes
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, position)
+        else:
+            with _seek_write_lock:
+                os.lseek(fd, position, os.SEEK_SET)
+                written = os.write(fd, view)
+        if not written:
+            raise OSError(f'Could not write to file descriptor {fd} at byte {position}')
+        view = view[written:]
+        position += written
+
+
+def _write_all(file, data):
+    # Writes all of `data` to a file object; raw (unbuffered) files may write only part of it per call
+    view = memoryview(data)
+    while view:
+        written = file.write(view)
+        # Objects that return None from write() are taken to have written everything, as buffered files do
+        if written is None:
+            return
+        if not written:
+            raise OSError(f'Could not write to {file!r}')
+        view = view[written:]
+
+
+def _skip_bytes(chunks, count: int):
+    # Drops the first `count` bytes of a chunk iterator, e.g. the part of a stream Drive already has
+    for chunk in chunks:
+        if count >= len(chunk):
+            count -= len(chunk)
+            continue
+        yield chunk[count:] if count else chunk
+        count = 0
 
 
 class GoogleWorkspaceService:
+    FILE_FIELDS = ['id', 'name', 'mimeType', 'description', 'createdTime']
+    # Drive accepts at most 100 calls in one batch request
+    BATCH_SIZE = 100
+
     def __init__(self, gc: GoogleCloudService = None):
         self.gc: GoogleCloudService = gc or GoogleCloudService()
         self._service_account: dict = None
@@ -21,12 +90,14 @@ class GoogleWorkspaceService:
         self._drive: Resource = None
         self._docs: Resource = None
         self._slides: Resource = None
+        self.content_cache: ContentCache = ContentCache()
+        self.change_page_token: str = None
 
     
     @property
     def service_account(self) -> dict:
         if not self._service_account:
-            self._service_account = self.gc.get_secret('docs-sa')
+            self._service_account = service_registry.secret(self.gc, 'docs-sa')
         return self._service_account
     
     @property
@@ -35,48 +106,557 @@ class GoogleWorkspaceService:
     
     @property
     def credentials(self):
-        return service_account.Credentials.from_service_account_info(
-            self.service_account, scopes=self.scopes
-        )
+        return service_registry.credentials(self.service_account, self.scopes)
 
     @property
     def drive(self) -> Resource:
         if not self._drive:
-            creds = service_account.Credentials.from_service_account_info(
-                self.service_account, scopes=self.scopes
-            )
-            self._drive = build('drive', 'v3', credentials=creds)
+            self._drive = service_registry.service('drive', 'v3', self.credentials)
         return self._drive
     
     @property
     def docs(self) -> Resource:
         if not self._docs:
-            creds = service_account.Credentials.from_service_account_info(
-                self.service_account, scopes=self.scopes
-            )
-            self._docs = build('docs', 'v1', credentials=creds)
+            self._docs = service_registry.service('docs', 'v1', self.credentials)
         return self._docs
     
     @property
     def slides(self) -> Resource:
         if not self._slides:
-            self._slides = build('slides', 'v1', credentials=self.credentials)
+            self._slides = service_registry.service('slides', 'v1', self.credentials)
         return self._slides
     
     
     def get_file(self, file_id: str) -> 'GoogleDriveFile':
         return GoogleDriveFile.from_file_id(google_workspace_service=self, file_id=file_id)
     
+    @property
+    def http(self) -> AuthorizedHttp:
+        # httplib2 is not thread-safe, so every thread gets its own authorized connection
+        return service_registry.http(self.credentials).http
+
     def get_files(self, folder_id: str) -> list['GoogleDriveFile']:
-        query_string = f"'{folder_id}' in parents"
-        files = self.drive.files().list(q=query_string, fields="nextPageToken, files(id, name, mimeType, description, createdTime)").execute()
-        return [GoogleDriveFile(google_workspace_service=self, **file) for file in files.get('files', [])]
+        return list(self.iter_files(folder_id))
     
     def get_files_with_query(self, query_string: str) -> list['GoogleDriveFile']:
-        files = self.drive.files().list(q=query_string, fields="nextPageToken, files(id, name, mimeType, description, createdTime)").execute()
-        return [GoogleDriveFile(google_workspace_service=self, **file) for file in files.get('files', [])]
+        return list(self.list_files(query_string))
+
+    def iter_files(self, folder_id: str, **kwargs) -> Generator['GoogleDriveFile', None, None]:
+        """
+        Lazily lists the direct children of a folder. Takes the same keyword arguments as list_files.
+        """
+        return self.list_files(f"'{folder_id}' in parents", **kwargs)
+
+    def list_files(self, query_string: str, fields: list[str] = None, page_size: int = 1000, prefetch: bool = False, **kwargs) -> Generator['GoogleDriveFile', None, None]:
+        """
+        Lazily lists every file matching a query, following nextPageToken until the last page.
+
+        Args:
+            query_string: A Drive search query, e.g. "'<folder id>' in parents".
+            fields: The file fields to request. Defaults to FILE_FIELDS.
+            page_size: The number of files per page (at most 1000).
+            prefetch: Fetch the next page on a background thread while the current one is consumed.
+            **kwargs: Extra files.list parameters, e.g. orderBy or driveId.
+
+        Yields:
+            GoogleDriveFile: The matching files, one page at a time.
+        """
+        params = {
+            'q': query_string,
+            'pageSize': page_size,
+            'fields': f"nextPageToken, files({', '.join(fields or self.FILE_FIELDS)})",
+            'supportsAllDrives': True,
+            'includeItemsFromAllDrives': True,
+        } | kwargs
+
+        def fetch(page_token: str) -> dict:
+            return self.drive.files().list(pageToken=page_token, **params).execute(http=self.http)
+
+        with (ThreadPoolExecutor(max_workers=1) if prefetch else nullcontext()) as executor:
+            page = fetch(None)
+            while True:
+                page_token = page.get('nextPageToken')
+                next_page = executor.submit(fetch, page_token) if executor and page_token else None
+
+                for file in page.get('files', []):
+                    yield GoogleDriveFile(google_workspace_service=self, **file)
+
+                if not page_token:
+                    return
+                page = next_page.result() if next_page else fetch(page_token)
+
+    def crawl(self, folder_id: str, max_workers: int = 8, checkpoint_path: str = None, follow_shortcuts: bool = True,
+              fields: list[str] = None, page_size: int = 1000, checkpoint_every: int = 100,
+              checkpoint_interval: float = 30) -> Generator['GoogleDriveFile', None, None]:
+        """
+        Walks a folder tree breadth-first, listing up to `max_workers` folders at a time, and yields every file and
+        folder as soon as its parent folder has been listed.
+
+        Each folder is listed once, so shortcuts that point back up the tree cannot cause cycles. With a
+        `checkpoint_path`, the pending and discovered folders are saved every `checkpoint_every` folders or
+        `checkpoint_interval` seconds, whichever comes first, and when the crawl stops early. A later call with the
+        same path and root folder resumes from there; folders listed since the last save are listed again. The
+        checkpoint is removed when the crawl completes.
+
+        Args:
+            folder_id: The ID of the root folder (or shared drive).
+            max_workers: The maximum number of concurrent files.list calls.
+            checkpoint_path: A JSON file used to persist and resume the crawl.
+            follow_shortcuts: Descend into folders reached through shortcuts.
+            fields: The file fields to request. Defaults to FILE_FIELDS.
+            page_size: The number of files per files.list page.
+            checkpoint_every: Save the checkpoint after this many folders.
+            checkpoint_interval: Save the checkpoint after this many seconds.
+
+        Yields:
+            GoogleDriveFile: Every file and folder below the root folder.
+
+        Raises:
+            ValueError: If the checkpoint at `checkpoint_path` belongs to a crawl of another folder.
+        """
+        fields = list(dict.fromkeys((fields or self.FILE_FIELDS) + ['parents', 'shortcutDetails']))
+
+        checkpoint = {'root': folder_id, 'pending': [folder_id], 'discovered': [folder_id]}
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('root') != folder_id:
+                raise ValueError(f"The checkpoint {checkpoint_path} is for folder {checkpoint.get('root')}, not {folder_id}")
+        pending = deque(checkpoint['pending'])
+        discovered = set(checkpoint['discovered'])
+        running = {}
+        # The folder whose files are being yielded stays in the checkpoint until all of them have been yielded
+        listing = None
+
+        def list_folder(folder_id: str) -> list['GoogleDriveFile']:
+            return list(self.iter_files(folder_id, fields=fields, page_size=page_size))
+
+        def save_checkpoint():
+            self._save_checkpoint(checkpoint_path, {
+                'root': folder_id,
+                'pending': ([listing] if listing else []) + list(running.values()) + list(pending),
+                'discovered': list(discovered)
+            })
+
+        # Rewriting the whole checkpoint after every folder is quadratic in the size of the tree, so saves are batched
+        unsaved, saved_at = 0, monotonic()
+        completed = False
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                while pending or running:
+                    while pending and len(running) < max_workers:
+                        next_folder_id = pending.popleft()
+                        running[executor.submit(list_folder, next_folder_id)] = next_folder_id
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        listing = running.pop(future)
+                        for file in future.result():
+                            child_folder_id = None
+                            if file.mime_type == FOLDER_MIME_TYPE:
+                                child_folder_id = file.id
+                            elif follow_shortcuts and file.shortcut_details.get('targetMimeType') == FOLDER_MIME_TYPE:
+                                child_folder_id = file.shortcut_details.get('targetId')
+
+                            if child_folder_id and child_folder_id not in discovered:
+                                discovered.add(child_folder_id)
+                                pending.append(child_folder_id)
+                            yield file
+                        listing = None
+
+                        unsaved += 1
+                        if checkpoint_path and (unsaved >= checkpoint_every or monotonic() - saved_at >= checkpoint_interval):
+                            save_checkpoint()
+                            unsaved, saved_at = 0, monotonic()
+            completed = True
+        finally:
+            if checkpoint_path and not completed:
+                save_checkpoint()
+
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    def _save_checkpoint(self, checkpoint_path: str, checkpoint: dict):
+        # Write to a temporary file first so an interruption never leaves a truncated checkpoint
+        temp_path = f'{checkpoint_path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, checkpoint_path)
+
+    def get_start_page_token(self, drive_id: str = None) -> str:
+        """
+        Gets the changes.list page token for the current state of My Drive, or of a shared drive.
+        """
+        params = {'driveId': drive_id} if drive_id else {}
+        return self.drive.changes().getStartPageToken(supportsAllDrives=True, **params).execute(http=self.http)['startPageToken']
+
+    def watch_changes(self, token_path: str = None, page_token: str = None, drive_id: str = None,
+                      fields: list[str] = None, page_size: int = 1000) -> Generator[tuple[str, 'GoogleDriveFile'], None, None]:
+        """
+        Lists what changed in Drive since the last call, using the changes feed instead of re-listing folders.
+
+        The page token is kept in `token_path` (and in `self.change_page_token`) after every page, so the next call
+        continues from there. Without a saved or given token, the first call only records the current token
+        and yields nothing.
+
+        Args:
+            token_path: A JSON file that persists the page token between calls (and processes).
+            page_token: Start from this token instead of the saved one.
+            drive_id: Watch this shared drive instead of My Drive.
+            fields: The file fields to request. Defaults to FILE_FIELDS.
+            page_size: The number of changes per changes.list page.
+
+        Yields:
+            tuple[str, GoogleDriveFile]: ('added' | 'modified' | 'removed', the file). Removed files (deleted,
+                trashed or no longer shared) only carry their ID.
+        """
+        state = {}
+        if token_path and os.path.exists(token_path):
+            with open(token_path, 'r') as f:
+                state = json.load(f)
+        page_token = page_token or state.get('page_token') or self.change_page_token
+        now = datetime.now(UTC).isoformat()
+
+        def save(token: str, synced_time: str):
+            self.change_page_token = token
+            if token_path:
+                self._save_checkpoint(token_path, {'page_token': token, 'synced_time': synced_time})
+
+        if not page_token:
+            save(self.get_start_page_token(drive_id), now)
+            return
+
+        # Files created after the previous sync started are new, older ones were modified
+        synced_time = datetime.fromisoformat(state['synced_time']) if state.get('synced_time') else None
+        fields = list(dict.fromkeys((fields or self.FILE_FIELDS) + ['createdTime', 'trashed']))
+        params = {
+            'pageSize': page_size,
+            'fields': f"nextPageToken, newStartPageToken, changes(changeType, removed, fileId, file({', '.join(fields)}))",
+            'supportsAllDrives': True,
+            'includeItemsFromAllDrives': True,
+            'includeRemoved': True,
+        }
+        if drive_id:
+            params['driveId'] = drive_id
+
+        while page_token:
+            page = self.drive.changes().list(pageToken=page_token, **params).execute(http=self.http)
+            for change in page.get('changes', []):
+                if change.get('changeType', 'file') != 'file':
+                    continue
+                file = change.get('file') or {}
+                if change.get('removed') or file.get('trashed'):
+                    yield 'removed', GoogleDriveFile(google_workspace_service=self, **(file | {'id': change['fileId']}))
+                    continue
+                created_time = datetime.fromisoformat(file['createdTime']) if file.get('createdTime') else None
+                added = synced_time is None or (created_time is not None and created_time >= synced_time)
+                yield 'added' if added else 'modified', GoogleDriveFile(google_workspace_service=self, **file)
+
+            if page.get('newStartPageToken'):
+                save(page['newStartPageToken'], now)
+                return
+            page_token = page.get('nextPageToken')
+            save(page_token, state.get('synced_time', now))
+
+    def execute_batch(self, requests: dict[str, HttpRequest], service: Resource = None) -> dict[str, dict]:
+        """
+        Executes many API requests using HTTP batch requests, up to BATCH_SIZE requests per round trip.
+
+        Args:
+            requests: The requests to send, keyed by an ID used to report each result (e.g. the file ID).
+            service: The service the requests were built from. Defaults to Drive.
+
+        Returns:
+            dict: {request ID: {'status': 'success', 'response': dict} or {'status': 'error', 'error': HttpError}}
+        """
+        service = service or self.drive
+        results = {}
+
+        def callback(request_id, response, exception):
+            if exception:
+                results[request_id] = {'status': 'error', 'error': exception}
+            else:
+                results[request_id] = {'status': 'success', 'response': response}
+
+        items = list(requests.items())
+        for start in range(0, len(items), self.BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=callback)
+            for request_id, request in items[start:start + self.BATCH_SIZE]:
+                batch.add(request, request_id=str(request_id))
+            batch.execute(http=self.http)
+        return results
+
+    def get_files_by_ids(self, file_ids: list[str], fields: list[str] = None) -> dict[str, 'GoogleDriveFile']:
+        """
+        Gets the metadata of many files with batched requests.
+
+        Args:
+            file_ids: The IDs (or URLs) of the files.
+            fields: The file fields to request. Defaults to all fields.
+
+        Returns:
+            dict: {file ID: GoogleDriveFile, or None if the file could not be read}
+        """
+        file_ids = [GoogleDriveFile.format_file_id(file_id) for file_id in file_ids]
+        params = {'fields': ', '.join(fields)} if fields else {}
+        results = self.execute_batch({
+            file_id: self.drive.files().get(fileId=file_id, supportsAllDrives=True, **params) for file_id in file_ids
+        })
+
+        files = {}
+        for file_id in file_ids:
+            result = results.get(file_id, {})
+            if result.get('status') == 'success':
+                files[file_id] = GoogleDriveFile(google_workspace_service=self, **result['response'])
+            else:
+                print(f"An error occurred while getting the file {file_id}: {result.get('error')}")
+                files[file_id] = None
+        return files
+
+    def share_files(self, file_ids: list[str], email_address: str, role: str = 'writer', send_notification_email: bool = True) -> dict[str, dict]:
+        """
+        Shares many files with a user with batched requests.
+
+        Args:
+            file_ids: The IDs of the files to share.
+            email_address: The email address to share the files with.
+            role: The role to grant, e.g. 'reader' or 'writer'.
+            send_notification_email: Whether Drive emails the user about each share.
+
+        Returns:
+            dict: {file ID: the status of the permission grant}
+        """
+        permission = {'type': 'user', 'role': role, 'emailAddress': email_address}
+        return self.execute_batch({
+            file_id: self.drive.permissions().create(
+                fileId=file_id, body=permission, sendNotificationEmail=send_notification_email, supportsAllDrives=True
+            ) for file_id in file_ids
+        })
+
+    def delete_files(self, file_ids: list[str]) -> dict[str, dict]:
+        """
+        Permanently deletes many files with batched requests.
+
+        Args:
+            file_ids: The IDs of the files to delete.
+
+        Returns:
+            dict: {file ID: the status of the delete}
+        """
+        return self.execute_batch({
+            file_id: self.drive.files().delete(fileId=file_id, supportsAllDrives=True) for file_id in file_ids
+        })
+
+    @property
+    def session(self) -> AuthorizedSession:
+        # One requests session per thread, used for streamed media downloads
+        return service_registry.session(self.credentials)
+
+    def media_request(self, file_id: str, mime_type: str = None) -> tuple[str, dict]:
+        """
+        Gets the URL and query parameters that return a file's content, or its export when `mime_type` is given.
+        """
+        if mime_type:
+            return f'{DRIVE_FILES_URL}/{file_id}/export', {'mimeType': mime_type}
+        return f'{DRIVE_FILES_URL}/{file_id}', {'alt': 'media', 'supportsAllDrives': 'true'}
+
+    def _stream_media(self, file_id: str, views: Callable[[int], memoryview], mime_type: str = None, offset: int = 0,
+                      progress_callback: Callable[[int, int], None] = None, max_retries: int = 5, end: int = None) -> Generator[memoryview, None, None]:
+        # Reads the file (or bytes offset..end inclusive) into the views returned by `views(position)` and yields each filled slice.
+        # After a dropped connection the download continues from the current position with an HTTP Range request.
+        url, params = self.media_request(file_id, mime_type)
+        position = offset
+        attempt = 0
+        while True:
+            if end is not None and position > end:
+                return
+            headers = {'Accept-Encoding': 'identity'}
+            if position or end is not None:
+                headers['Range'] = f"bytes={position}-{'' if end is None else end}"
+            try:
+                with self.session.get(url, params=params, headers=headers, stream=True, timeout=(30, 300)) as response:
+                    if response.status_code == 416:
+                        return
+                    response.raise_for_status()
+                    total = self._content_total(response, position)
+                    raw = response.raw
+
+                    # Exports ignore Range and start from byte 0, so skip what was already written
+                    if position and response.status_code == 200:
+                        skip, scratch = position, memoryview(bytearray(64 * 1024))
+                        while skip:
+                            read = raw.readinto(scratch[:min(skip, len(scratch))])
+                            if not read:
+                                raise ConnectionError('Connection closed while skipping to the resume position')
+                            skip -= read
+
+                    while True:
+                        view = views(position)
+                        read = raw.readinto(view)
+                        if not read:
+                            if not len(view) and raw.read(1):
+                                raise ValueError('The destination buffer is smaller than the file')
+                            return
+                        position += read
+                        attempt = 0
+                        yield view[:read]
+                        if progress_callback:
+                            progress_callback(position, total)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    urllib3.exceptions.HTTPError, ConnectionError) as e:
+                error = e
+            except requests.HTTPError as e:
+                if e.response.status_code not in (429, 500, 502, 503, 504):
+                    raise e
+                error = e
+
+            attempt += 1
+            if attempt > max_retries:
+                raise error
+            delay = min(64, 2 ** attempt) * (0.5 + random() / 2)
+            print(f'Download of {file_id} interrupted at byte {position} ({error}), resuming in {delay:.1f} seconds')
+            sleep(delay)
+
+    @staticmethod
+    def _content_total(response: requests.Response, position: int) -> int:
+        content_range = response.headers.get('Content-Range')
+        if content_range and '/' in content_range and not content_range.endswith('/*'):
+            return int(content_range.rsplit('/', 1)[1])
+        content_length = response.headers.get('Content-Length')
+        if content_length:
+            return int(content_length) + (position if response.status_code == 206 else 0)
+        return None
+
+    def stream_download(self, file_id: str, destination, mime_type: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        offset: int = 0, progress_callback: Callable[[int, int], None] = None, max_retries: int = 5) -> int:
+        """
+        Streams a file from Google Drive into a destination in constant memory.
+
+        Args:
+            file_id: The ID of the file to download.
+            destination: Where to write the content. One of:
+                a file path (str or PathLike), opened and written from `offset`;
+                an OS file descriptor (int), written at the file offset (with pwrite where available);
+                a writable file object (anything with `write`), written at its current position;
+                a writable buffer (bytearray, memoryview or mmap) at least as large as the file, read into directly without copying.
+            mime_type: Export the file to this MIME type (for Google Docs, Sheets and Slides).
+            chunk_size: The number of bytes read per chunk.
+            offset: The byte to start from, e.g. the size of a partial earlier download.
+            progress_callback: Called as progress_callback(bytes_downloaded, total_bytes) after each chunk. total_bytes is None if unknown.
+            max_retries: The number of times a dropped download is resumed before giving up.
+
+        Returns:
+            int: The position after the last byte written, i.e. the file size for a complete download.
+        """
+        position = offset
+        with ExitStack() as stack:
+            if isinstance(destination, (bytearray, memoryview, mmap.mmap)):
+                buffer = memoryview(destination).cast('B')
+                views = lambda position: buffer[position:position + chunk_size]
+                write = None
+            else:
+                scratch = memoryview(bytearray(chunk_size))
+                views = lambda position: scratch
+                if isinstance(destination, (str, os.PathLike)):
+                    file = stack.enter_context(open(destination, 'r+b' if offset and os.path.exists(destination) else 'wb'))
+                    file.seek(offset)
+                    write = lambda chunk, position: file.write(chunk)
+                elif isinstance(destination, int):
+                    write = lambda chunk, position: _write_at(destination, chunk, position)
+                else:
+                    write = lambda chunk, position: _write_all(destination, chunk)
+
+            for chunk in self._stream_media(file_id, views, mime_type=mime_type, offset=offset,
+                                            progress_callback=progress_callback, max_retries=max_retries):
+                if write:
+                    write(chunk, position)
+                position += len(chunk)
+        return position
+
+    def parallel_download(self, file_id: str, destination: str, size: int = None, part_size: int = DEFAULT_PART_SIZE,
+                          max_workers: int = 8, chunk_size: int = 1024 * 1024,
+                          progress_callback: Callable[[int, int], None] = None, max_retries: int = 5) -> int:
+        """
+        Downloads a large file over several connections at once. The file is split into byte ranges of `part_size`,
+        each range is fetched on a thread pool (and resumed on failure) and written at its offset in a preallocated
+        temporary file next to the destination, which replaces the destination only once every range has arrived.
+        Files no larger than `part_size` are streamed over one connection into the temporary file instead.
+        If the download fails, the temporary file is deleted and the destination is left untouched. Google Docs, Sheets and Slides have no byte content and cannot be downloaded this way;
+        use stream_download with an export mime_type instead.
+
+        Args:
+            file_id: The ID of the file to download.
+            destination: The path of the file to write.
+            size: The size of the file in bytes. Read from the file metadata when not given.
+            part_size: The size of each byte range.
+            max_workers: The number of ranges fetched concurrently.
+            chunk_size: The number of bytes read per chunk within a range.
+            progress_callback: Called as progress_callback(bytes_downloaded, total_bytes). It may be called from any worker thread.
+            max_retries: The number of times each range is resumed before giving up.
 
-    def download_chunks(self, file_id: str) -> Generator[bytes, None, None]:
+        Returns:
+            int: The size of the downloaded file.
+        """
+        if size is None:
+            size = int(self.drive.files().get(fileId=file_id, fields='size', supportsAllDrives=True).execute(http=self.http)['size'])
+
+        directory, name = os.path.split(os.path.abspath(destination))
+        temp_path = os.path.join(directory, f'.{name}.{uuid4().hex}.part')
+
+        # A single range is streamed over one connection, into the same kind of temporary file
+        if size <= part_size or max_workers <= 1:
+            try:
+                size = self.stream_download(file_id, temp_path, chunk_size=chunk_size, progress_callback=progress_callback, max_retries=max_retries)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            os.replace(temp_path, destination)
+            return size
+
+        fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        downloaded = 0
+        progress_lock = threading.Lock()
+        try:
+            os.ftruncate(fd, size)
+
+            def fetch_range(start: int, end: int):
+                # Each worker reads into its own scratch buffer and writes it at the range's offset in the file
+                nonlocal downloaded
+                scratch = memoryview(bytearray(min(chunk_size, end - start + 1)))
+                views = lambda position: scratch[:min(len(scratch), end + 1 - position)]
+                position = start
+                for chunk in self._stream_media(file_id, views, offset=start, end=end, max_retries=max_retries):
+                    _write_at(fd, chunk, position)
+                    position += len(chunk)
+                    with progress_lock:
+                        downloaded += len(chunk)
+                        if progress_callback:
+                            progress_callback(downloaded, size)
+                if position != end + 1:
+                    raise ConnectionError(f'Range {start}-{end} of {file_id} ended at byte {position}')
+
+            ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(fetch_range, start, end) for start, end in ranges]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        except BaseException:
+            os.close(fd)
+            os.remove(temp_path)
+            raise
+
+        os.close(fd)
+        os.replace(temp_path, destination)
+        return size
+
+    def download_chunks(self, file_id: str, mime_type: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        progress_callback: Callable[[int, int], None] = None) -> Generator[bytes, None, None]:
         """
         Lazily downloads a file from Google Drive, yielding it in chunks.
 
@@ -85,39 +665,261 @@ class GoogleWorkspaceService:
 
         Args:
             file_id: The ID of the file to download.
+            mime_type: Export the file to this MIME type (for Google Docs, Sheets and Slides).
+            chunk_size: The maximum size of each chunk in bytes.
+            progress_callback: Called as progress_callback(bytes_downloaded, total_bytes) after each chunk.
 
         Yields:
             bytes: Chunks of the file's content.
         """
-        request = self.drive.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-            print(f"Download {int(status.progress() * 100)}%.")
-            yield fh.getvalue()
-            # Reset the buffer for the next chunk.
-            fh.seek(0)
-            fh.truncate(0)
-
-
-    def download_file(self, file_id) -> io.BytesIO:
-        request = self.drive.files().get_media(fileId=file_id)
+        scratch = memoryview(bytearray(chunk_size))
+        for chunk in self._stream_media(file_id, lambda position: scratch, mime_type=mime_type, progress_callback=progress_callback):
+            yield bytes(chunk)
+
+
+    def read_range(self, file_id: str, start: int, end: int) -> bytes:
+        """
+        Downloads bytes start..end (inclusive) of a binary file.
+        """
+        buffer = memoryview(bytearray(end - start + 1))
+        position = start
+        for chunk in self._stream_media(file_id, lambda position: buffer[position - start:], offset=start, end=end):
+            position += len(chunk)
+        return bytes(buffer[:position - start])
+
+    def probe_resolution(self, file_id: str) -> tuple[int, int]:
+        """
+        Gets the width and height of a video without downloading it.
+
+        Drive's own videoMediaMetadata is used when Drive has processed the video; otherwise only the container
+        metadata is fetched with byte-range requests (see media_probe.probe_resolution). Results are kept in the
+        content cache per file version, so repeated calls cost a single metadata request.
+
+        Args:
+            file_id: The ID of the video.
+
+        Returns:
+            tuple[int, int]: (width, height), or None if the file has no readable video track.
+        """
+        metadata = self.drive.files().get(
+            fileId=file_id, fields='size, md5Checksum, version, videoMediaMetadata(width, height)', supportsAllDrives=True
+        ).execute(http=self.http)
+        video = metadata.get('videoMediaMetadata') or {}
+        if video.get('width') and video.get('height'):
+            return (video['width'], video['height'])
+
+        key = self.content_cache.key(file_id, metadata.get('md5Checksum') or metadata.get('version'), 'probe/resolution')
+        path = self.content_cache.get(key)
+        if path:
+            with open(path, 'r') as f:
+                resolution = json.load(f)
+            return tuple(resolution) if resolution else None
+
+        resolution = probe_resolution(lambda start, end: self.read_range(file_id, start, end), int(metadata.get('size') or 0))
+        self.content_cache.put(key, json.dumps(resolution).encode('utf-8'))
+        return resolution
+
+    def cached_download(self, file_id: str, mime_type: str = None, progress_callback: Callable[[int, int], None] = None) -> str:
+        """
+        Downloads (or exports) a file into the local content cache, unless an up-to-date copy is already there.
+        Freshness is checked with a single metadata call for the md5Checksum (binary files) or version (Google Docs, Sheets and Slides).
+
+        Args:
+            file_id: The ID of the file to download.
+            mime_type: Export the file to this MIME type (for Google Docs, Sheets and Slides).
+            progress_callback: Called as progress_callback(bytes_downloaded, total_bytes) after each chunk.
+
+        Returns:
+            str: The path of the cached copy, or None if the file has no validator to cache it by or is too large for the cache.
+        """
+        key = self._content_cache_key(file_id, mime_type)
+        if not key:
+            return None
+        path = self.content_cache.get(key)
+        if path:
+            return path
+
+        with self.content_cache.writer(key) as f:
+            self.stream_download(file_id, f, mime_type=mime_type, progress_callback=progress_callback)
+        return self.content_cache.get(key)
+
+    def _content_cache_key(self, file_id: str, mime_type: str = None) -> str:
+        # The cache key for the current content of a file, or None if it has no validator or is known to be too large
+        metadata = self.drive.files().get(fileId=file_id, fields='md5Checksum, version, size', supportsAllDrives=True).execute(http=self.http)
+        validator = metadata.get('md5Checksum') or metadata.get('version')
+        if not validator:
+            return None
+        # Exports have no size up front; the cache drops those after the fact if they don't fit
+        if not mime_type and metadata.get('size') and not self.content_cache.fits(int(metadata['size'])):
+            return None
+        return self.content_cache.key(file_id, validator, mime_type)
+
+    def download_file(self, file_id, mime_type: str = None, destination=None,
+                      progress_callback: Callable[[int, int], None] = None, use_cache: bool = False) -> io.BytesIO:
+        """
+        Downloads a file from Google Drive.
+
+        Args:
+            file_id: The ID of the file to download.
+            mime_type: Export the file to this MIME type (for Google Docs, Sheets and Slides).
+            destination: Stream into this destination instead of memory. See stream_download.
+            progress_callback: Called as progress_callback(bytes_downloaded, total_bytes) after each chunk.
+            use_cache: Serve the file from the local content cache when it is unchanged, and cache it otherwise.
+
+        Returns:
+            io.BytesIO: The file content, or the destination if one was given.
+        """
+        key = self._content_cache_key(file_id, mime_type) if use_cache and destination is None else None
+        if key:
+            path = self.content_cache.get(key)
+            if path:
+                with open(path, 'rb') as f:
+                    return io.BytesIO(f.read())
+
+        if destination is not None:
+            # A caller's file object is left positioned after the download, like any other write
+            self.stream_download(file_id, destination, mime_type=mime_type, progress_callback=progress_callback)
+            return destination
+
         fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-            print("Download %d%%." % int(status.progress() * 100))
-        
+        self.stream_download(file_id, fh, mime_type=mime_type, progress_callback=progress_callback)
+        # The content is downloaded once and copied into the cache from memory, and only if the cache can hold it
+        if key and self.content_cache.fits(fh.tell()):
+            self.content_cache.put(key, fh.getvalue())
         fh.seek(0)
         return fh
+
+    def _upload_source(self, source, metadata: dict, mime_type: str = None, session_key: str = None):
+        # Normalizes an upload source to (chunk iterator factory, size, mime type, session key)
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+
+        if isinstance(source, (str, os.PathLike)):
+            path = os.path.abspath(source)
+            stat = os.stat(path)
+            mime_type = mime_type or mimetypes.guess_type(path)[0]
+            if session_key is None:
+                session_key = f'{path}|{stat.st_size}|{stat.st_mtime_ns}|{json.dumps(metadata, sort_keys=True)}'
+
+            def chunks(offset: int, chunk_size: int):
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    yield from iter(lambda: f.read(chunk_size), b'')
+            return chunks, stat.st_size, mime_type, session_key
+
+        if hasattr(source, 'read'):
+            size, start = None, None
+            if source.seekable():
+                start = source.tell()
+                size = source.seek(0, os.SEEK_END) - start
+                source.seek(start)
+
+            def chunks(offset: int, chunk_size: int):
+                if start is None:
+                    yield from _skip_bytes(iter(lambda: source.read(chunk_size), b''), offset)
+                    return
+                source.seek(start + offset)
+                yield from iter(lambda: source.read(chunk_size), b'')
+            return chunks, size, mime_type, session_key
+
+        return lambda offset, chunk_size: _skip_bytes(iter(source), offset), None, mime_type, session_key
+
+    def upload(self, source, metadata: dict, mime_type: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               session_key: str = None, progress_callback: Callable[[int, int], None] = None, max_retries: int = 5,
+               fields: str = 'id, name, mimeType') -> dict:
+        """
+        Uploads a file to Google Drive with a resumable, chunked upload in constant memory.
+
+        Args:
+            source: The content. One of:
+                a file path (str or PathLike);
+                bytes, bytearray or memoryview;
+                a readable file object, read from its current position;
+                an iterable of bytes chunks, e.g. a generator.
+            metadata: The Drive file metadata, e.g. {'name': ..., 'parents': [...]}.
+            mime_type: The content's MIME type. Guessed from the file name for paths.
+            chunk_size: The number of bytes sent per request, rounded up to a multiple of 256 KiB.
+            session_key: Persists the upload session under this key, so an interrupted upload with the same key
+                continues where it stopped. Defaults to the path, size and modification time for file paths.
+            progress_callback: Called as progress_callback(bytes_uploaded, total_bytes) after each chunk. total_bytes is None if unknown.
+            max_retries: The number of times a failed request is retried before giving up.
+            fields: The fields of the created file to return.
+
+        Returns:
+            dict: The created file.
+        """
+        chunks, size, mime_type, session_key = self._upload_source(source, metadata, mime_type, session_key)
+        upload = ResumableUpload(
+            self.session, metadata, mime_type or 'application/octet-stream', size=size, chunk_size=chunk_size,
+            session_key=session_key, fields=fields, progress_callback=progress_callback, max_retries=max_retries
+        )
+        offset = upload.begin()
+        if upload.result is not None:
+            return upload.result
+
+        for chunk in chunks(offset, upload.chunk_size):
+            upload.write(chunk)
+            upload.flush()
+        return upload.finish()
+
+    async def upload_async(self, source, metadata: dict, mime_type: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           session_key: str = None, progress_callback: Callable[[int, int], None] = None,
+                           max_retries: int = 5, fields: str = 'id, name, mimeType') -> dict:
+        """
+        Uploads a file to Google Drive without blocking the event loop. Takes the same arguments as upload,
+        and `source` may also be an async iterator of bytes chunks, e.g. media streamed from a generation API.
+
+        Returns:
+            dict: The created file.
+        """
+        if not hasattr(source, '__aiter__'):
+            return await asyncio.to_thread(
+                self.upload, source, metadata, mime_type=mime_type, chunk_size=chunk_size, session_key=session_key,
+                progress_callback=progress_callback, max_retries=max_retries, fields=fields
+            )
+
+        upload = ResumableUpload(
+            self.session, metadata, mime_type or 'application/octet-stream', chunk_size=chunk_size,
+            session_key=session_key, fields=fields, progress_callback=progress_callback, max_retries=max_retries
+        )
+        skip = await asyncio.to_thread(upload.begin)
+        if upload.result is not None:
+            return upload.result
+
+        async for chunk in source:
+            if skip:
+                # Drive already has the start of the stream from an earlier attempt
+                dropped = min(skip, len(chunk))
+                chunk, skip = chunk[dropped:], skip - dropped
+            upload.write(chunk)
+            if upload.ready:
+                await asyncio.to_thread(upload.flush)
+        return await asyncio.to_thread(upload.finish)
+
+    def upload_many(self, uploads: list[dict], max_workers: int = 4) -> list[dict]:
+        """
+        Runs many uploads concurrently.
+
+        Args:
+            uploads: The keyword arguments of each upload call, e.g. [{'source': path, 'metadata': {...}}, ...].
+            max_workers: The number of uploads in flight at once.
+
+        Returns:
+            list[dict]: For each upload, in order, {'status': 'success', 'response': file} or {'status': 'error', 'description': ...}.
+        """
+        def run(kwargs: dict) -> dict:
+            try:
+                return {'status': 'success', 'response': self.upload(**kwargs)}
+            except Exception as e:
+                return {'status': 'error', 'description': str(e)}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run, uploads))
     
     
     def create_google_doc_from_markdown(self, title:str, markdown: str, email_address: str):
         from .google_doc import GoogleDoc
-        return GoogleDoc.new_from_markdown(self.credentials, self.drive, title, markdown, email_address)
+        return GoogleDoc.new_from_markdown(self, title, markdown, email_address)
     
     
     
@@ -158,6 +960,19 @@ class GoogleDriveFile:
     def mime_type(self) -> str:
         return self._kwargs.get('mimeType', None)
     
+    @property
+    def size(self) -> int:
+        size = self._kwargs.get('size')
+        return int(size) if size is not None else None
+
+    @property
+    def parents(self) -> list[str]:
+        return self._kwargs.get('parents', [])
+
+    @property
+    def shortcut_details(self) -> dict:
+        return self._kwargs.get('shortcutDetails', {})
+
     @property
     def created_time(self) -> datetime:
         date_string = self._kwargs.get('createdTime')
@@ -196,23 +1011,36 @@ class GoogleDriveFile:
     @property
     def file(self) -> io.BytesIO:
         if not self._file:
-            if self.mime_type == 'application/vnd.google-apps.document':
-                self._file = self.download_google_doc_as_pdf()
-            elif self.mime_type == 'application/vnd.google-apps.spreadsheet':
-                self._file = self.download_google_spreadsheet_as_csv()
-            else:
-                request = self.google_workspace_service.drive.files().get_media(fileId=self.id)
-                fh = io.BytesIO()
-                downloader = MediaIoBaseDownload(fh, request)
-                done = False
-                while done is False:
-                    status, done = downloader.next_chunk()
-                    print("Download %d%%." % int(status.progress() * 100))
-                
-                fh.seek(0)
-                self._file = fh
+            self._file = self.google_workspace_service.download_file(self.id, mime_type=self.export_mime_type, use_cache=True)
         self._file.seek(0)
         return self._file
+
+    @property
+    def resolution(self) -> tuple[int, int]:
+        # Reads only the container metadata, see GoogleWorkspaceService.probe_resolution
+        if not self._resolution:
+            self._resolution = self.google_workspace_service.probe_resolution(self.id)
+        return self._resolution
+
+    @property
+    def export_mime_type(self) -> str:
+        # Google Docs and Sheets have no binary content of their own and have to be exported
+        if self.mime_type in ('application/vnd.google-apps.document', 'application/vnd.google-apps.spreadsheet'):
+            return self.file_mime_type
+        return None
+
+    def download_to(self, destination, progress_callback: Callable[[int, int], None] = None, max_workers: int = None, **kwargs) -> int:
+        """
+        Streams the file into a path, file descriptor, file object or buffer without holding it in memory. See GoogleWorkspaceService.stream_download.
+        With `max_workers` and a path destination, binary files are fetched over several connections. See GoogleWorkspaceService.parallel_download.
+        """
+        if max_workers and not self.export_mime_type and isinstance(destination, (str, os.PathLike)):
+            return self.google_workspace_service.parallel_download(
+                self.id, destination, size=self.size, max_workers=max_workers, progress_callback=progress_callback, **kwargs
+            )
+        return self.google_workspace_service.stream_download(
+            self.id, destination, mime_type=self.export_mime_type, progress_callback=progress_callback, **kwargs
+        )
     
     
     @property
@@ -226,24 +1054,29 @@ class GoogleDriveFile:
     
     
     
-    def upload_file(self, file_bytes:bytes, mime_type:str, share_with_email: str = None):
-        media = MediaIoBaseUpload(
-            io.BytesIO(file_bytes),
-            mimetype=mime_type,
-            resumable=True,
-        )
-        file = (
-            self.google_workspace_service.drive.files()
-            .create(body=self._kwargs, media_body=media, fields="id")
-            .execute()
-        )
+    def upload_file(self, source, mime_type: str, share_with_email: str = None, **kwargs):
+        """
+        Uploads content as this file, using the file's metadata (name, parents, ...) from the constructor.
+
+        Args:
+            source: A file path, bytes, a file object or an iterable of bytes chunks. See GoogleWorkspaceService.upload.
+            mime_type: The content's MIME type.
+            share_with_email: Give this user writer access once the upload completes.
+            **kwargs: Passed to GoogleWorkspaceService.upload, e.g. chunk_size or progress_callback.
+
+        Returns:
+            str: The ID of the uploaded file.
+        """
+        file = self.google_workspace_service.upload(source, self._kwargs, mime_type=mime_type, **kwargs)
+        self._kwargs.update(file)
         file_id = file.get("id")
 
-        try:
-            permission = {"type": "user", "role": "writer", "emailAddress": share_with_email}
-            self.google_workspace_service.drive.permissions().create(fileId=file_id, body=permission).execute()
-            print(f"Shared the file with {share_with_email}")
-        except HttpError as error:
-            print(f"An error occurred while sharing the file: {error}")
+        if share_with_email:
+            try:
+                permission = {"type": "user", "role": "writer", "emailAddress": share_with_email}
+                self.google_workspace_service.drive.permissions().create(fileId=file_id, body=permission).execute()
+                print(f"Shared the file with {share_with_email}")
+            except HttpError as error:
+                print(f"An error occurred while sharing the file: {error}")
         
-        return file_id
\ No newline at end of file
+        return file_id
@@ -1,16 +1,244 @@
 from googleapiclient.discovery import build, Resource
 from google_cloud import GoogleCloudService, google_cloud_client
 import mistune
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 import io
 from googleapiclient.errors import HttpError
 from .google_drive_service import GoogleDriveFile
+from .sheets_quota import QuotaHTTPClient, quota_manager
+from .content_cache import CACHE_DIR
 import gspread
-from time import sleep
+from gspread.utils import rowcol_to_a1, a1_to_rowcol, numericise_all, to_records
+from time import sleep, monotonic
+from random import random
+from threading import Lock
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
 from google.genai import Client, types
+from google.genai import errors as genai_errors
 import json
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from hashlib import sha256
 from tqdm import tqdm
 from uuid import uuid4
+from datetime import datetime, UTC
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .worksheet_snapshot import WorksheetSnapshot
+
+# Worksheet summaries are persisted by content hash so later sessions can reuse them
+SUMMARY_CACHE_DIR = os.path.join(CACHE_DIR, 'worksheet_summaries')
+_summary_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='worksheet-summary')
+
+class LRUCache():
+    """
+    A small thread-safe least-recently-used cache
+    """
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class WorksheetWriteBuffer():
+    """
+    Collects cell edits, row appends and row deletes for a worksheet and sends them as a single spreadsheets.batchUpdate.
+
+    All row and column numbers refer to the worksheet as it was when the buffer was opened, so deletes never shift
+    the rows of later edits. On commit, cell edits are applied first, then deletes from the bottom up, then appends.
+    Nothing is sent if the block raises.
+
+    Like gspread, values are written RAW by default, so a string that starts with '=' is stored as text. Pass
+    value_input_option='USER_ENTERED' to have such strings written as formulas.
+
+    Usage:
+        with worksheet.batch() as batch:
+            batch.set_cell(2, 3, 'value')
+            batch.delete_rows(5)
+            batch.append_row(['a', 'b'])
+    """
+    def __init__(self, worksheet: 'GoogleSheetWorksheet', value_input_option: str = 'RAW'):
+        if value_input_option not in ('RAW', 'USER_ENTERED'):
+            raise ValueError(f"value_input_option must be 'RAW' or 'USER_ENTERED', not {value_input_option!r}")
+        self.worksheet = worksheet
+        self.value_input_option = value_input_option
+        self._cells: dict[tuple[int, int], object] = {}
+        self._deleted_row_numbers: set[int] = set()
+        self._appended_rows: list[list] = []
+
+    def __enter__(self) -> 'WorksheetWriteBuffer':
+        self.worksheet._write_buffer = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.worksheet._write_buffer = None
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def set_cell(self, row_number: int, column_number: int, value):
+        self._cells[(row_number, column_number)] = value
+
+    def update_range(self, first_row_number: int, first_column_number: int, values: list[list]):
+        for row_offset, row in enumerate(values):
+            for column_offset, value in enumerate(row):
+                self.set_cell(first_row_number + row_offset, first_column_number + column_offset, value)
+
+    def clear_range(self, first_row_number: int, first_column_number: int, last_row_number: int, last_column_number: int):
+        for row_number in range(first_row_number, last_row_number + 1):
+            for column_number in range(first_column_number, last_column_number + 1):
+                self.set_cell(row_number, column_number, '')
+
+    def delete_rows(self, start_row_number: int, end_row_number: int = None):
+        self._deleted_row_numbers.update(range(start_row_number, (end_row_number or start_row_number) + 1))
+
+    def append_row(self, row: list):
+        self._appended_rows.append(list(row))
+
+    def append_rows(self, rows: list[list]):
+        for row in rows:
+            self.append_row(row)
+
+    def _is_formula(self, value) -> bool:
+        return self.value_input_option == 'USER_ENTERED' and isinstance(value, str) and value.startswith('=')
+
+    def _cell_data(self, value) -> dict:
+        if value is None or value == '':
+            return {}
+        if isinstance(value, bool):
+            return {'userEnteredValue': {'boolValue': value}}
+        if isinstance(value, (int, float)):
+            return {'userEnteredValue': {'numberValue': value}}
+        if self._is_formula(value):
+            return {'userEnteredValue': {'formulaValue': value}}
+        return {'userEnteredValue': {'stringValue': str(value)}}
+
+    @staticmethod
+    def _runs(numbers: list[int]) -> list[tuple[int, int]]:
+        # Merges sorted numbers into inclusive (start, end) runs
+        runs = []
+        for number in numbers:
+            if runs and number == runs[-1][1] + 1:
+                runs[-1][1] = number
+            else:
+                runs.append([number, number])
+        return [tuple(run) for run in runs]
+
+    def _cell_blocks(self, cells: dict[tuple[int, int], object]) -> list[tuple[int, int, int, int]]:
+        # Contiguous column runs per row, merged across consecutive rows with the same run into rectangles
+        columns_by_row: dict[int, list[int]] = {}
+        for row_number, column_number in sorted(cells):
+            columns_by_row.setdefault(row_number, []).append(column_number)
+
+        blocks = []
+        open_blocks: dict[tuple[int, int], list] = {}
+        for row_number in sorted(columns_by_row):
+            for run in self._runs(columns_by_row[row_number]):
+                block = open_blocks.get(run)
+                if block and block[2] == row_number - 1:
+                    block[2] = row_number
+                else:
+                    block = [row_number, run[0], row_number, run[1]]
+                    open_blocks[run] = block
+                    blocks.append(block)
+        return [tuple(block) for block in blocks]
+
+    @property
+    def requests(self) -> list[dict]:
+        sheet_id = self.worksheet.id
+        cells = {key: value for key, value in self._cells.items() if key[0] not in self._deleted_row_numbers}
+
+        requests = []
+        for first_row, first_column, last_row, last_column in self._cell_blocks(cells):
+            requests.append({
+                'updateCells': {
+                    'range': {
+                        'sheetId': sheet_id,
+                        'startRowIndex': first_row - 1,
+                        'endRowIndex': last_row,
+                        'startColumnIndex': first_column - 1,
+                        'endColumnIndex': last_column
+                    },
+                    'rows': [
+                        {'values': [self._cell_data(cells[(row, column)]) for column in range(first_column, last_column + 1)]}
+                        for row in range(first_row, last_row + 1)
+                    ],
+                    'fields': 'userEnteredValue'
+                }
+            })
+
+        # Bottom-up so each delete leaves the rows above it where they were
+        for start, end in reversed(self._runs(sorted(self._deleted_row_numbers))):
+            requests.append({
+                'deleteDimension': {
+                    'range': {'sheetId': sheet_id, 'dimension': 'ROWS', 'startIndex': start - 1, 'endIndex': end}
+                }
+            })
+
+        if self._appended_rows:
+            requests.append({
+                'appendCells': {
+                    'sheetId': sheet_id,
+                    'rows': [{'values': [self._cell_data(value) for value in row]} for row in self._appended_rows],
+                    'fields': 'userEnteredValue'
+                }
+            })
+        return requests
+
+    def commit(self) -> dict:
+        """
+        Sends the buffered writes as one spreadsheets.batchUpdate
+
+        Returns:
+            dict: the batchUpdate response, or an empty dict if there was nothing to send
+        """
+        requests = self.requests
+        if not requests:
+            return {}
+
+        with self.worksheet._own_write():
+            result = self.worksheet.worksheet.spreadsheet.batch_update({'requests': requests})
+
+            # A formula's cached value would be its text rather than its result, so those writes refetch too
+            written = [*self._cells.values(), *(value for row in self._appended_rows for value in row)]
+            if self._deleted_row_numbers or any(self._is_formula(value) for value in written):
+                self.worksheet.invalidate()
+            else:
+                for (row_number, column_number), value in self._cells.items():
+                    self.worksheet._set_cached_cell(row_number, column_number, value)
+                self.worksheet._append_cached_rows(self._appended_rows)
+
+        self._cells = {}
+        self._deleted_row_numbers = set()
+        self._appended_rows = []
+        return result
+
 
 class GoogleSheetWorksheet():
     def __init__(self, google_sheet: 'GoogleSheet', worksheet: gspread.Worksheet, **kwargs):
@@ -18,15 +246,158 @@ class GoogleSheetWorksheet():
         self.worksheet: gspread.Worksheet = worksheet
         self._records: list[dict] = []
         self._values: list[list] = []
+        # The Drive version the grid matches, or when it was last known to match (fetched or written by us).
+        # The version itself is only looked up by is_stale() and sync().
+        self._synced_version: dict = None
+        self._synced_at: datetime = None
+        # Set once is_stale() or sync() is used; until then our own writes skip the Drive version check
+        self._tracks_versions: bool = False
         self._summary: str = None
+        self._summary_future: Future = None
+        self._summary_lock = Lock()
         self.genai_client: Client = google_cloud_client.genai_client
 
+        # Hash indexes over the fetched records, built once per fetch
+        self._indexed_records: list[dict] = []
+        self._indexed_headers: list[dict] = []
+        self._records_by_row_number: dict[int, dict] = {}
+        self._headers_by_column_number: dict[int, dict] = {}
+        self._headers_by_column_name: dict[str, dict] = {}
+        self._snapshot = None
+        self._write_buffer: WorksheetWriteBuffer = None
+
+        # Memoised natural-language lookups, keyed by the grid revision they were resolved against
+        self._revision: int = 0
+        self._resolution_cache = LRUCache(maxsize=kwargs.get('resolution_cache_size', 256))
+        self.header_match_threshold: float = kwargs.get('header_match_threshold', 0.85)
+
+        # Shared state for the concurrent column fill in update_all_rows
+        self._backoff_lock = Lock()
+        self._backoff_until: float = 0
+        self.last_flushed_row_index: int = None
+
+        # Compressed worksheet context shared by the per-row prompts
+        self.context_exemplars: int = kwargs.get('context_exemplars', 20)
+        self.use_context_cache: bool = kwargs.get('use_context_cache', True)
+        self.context_cache_ttl: str = kwargs.get('context_cache_ttl', '3600s')
+        self._context: str = None
+        # One live cache per (model, tools), with the hash of the context it holds
+        self._context_caches: dict[str, tuple[str, types.CachedContent]] = {}
+        self._context_cache_lock = Lock()
+
+
+    def batch(self, value_input_option: str = 'RAW') -> WorksheetWriteBuffer:
+        """
+        Opens a write buffer. Used as a context manager, the worksheet's own write methods (clear_range, clear_a_column,
+        update_row, delete_row, delete_rows, append_row, add_additional_row) are collected and sent as one batchUpdate on exit.
+        Row and column numbers inside the block refer to the worksheet as it was when the block started.
+
+        Args:
+            value_input_option (str, optional): 'RAW' stores every string as text; 'USER_ENTERED' writes strings
+                starting with '=' as formulas. Defaults to 'RAW', like gspread.
+
+        Returns:
+            WorksheetWriteBuffer: the write buffer
+        """
+        return WorksheetWriteBuffer(self, value_input_option=value_input_option)
+
+    def __enter__(self) -> 'GoogleSheetWorksheet':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Deletes the worksheet's Gemini context caches, which otherwise keep billing storage until their TTL expires
+        """
+        self.delete_context_caches()
 
     def refresh(self):
         sheet_worksheets = self.google_sheet.spreadsheet.worksheets()
         self.worksheet = list(filter(lambda worksheet: worksheet.id == self.worksheet.id, sheet_worksheets))[0]
+        self.invalidate()
+        self.delete_context_caches()
+        with self._summary_lock:
+            self._summary = None
+            self._summary_future = None
+
+    def invalidate(self):
+        """
+        Drops the cached grid and its indexes so the next access refetches the worksheet
+        """
+        self._values = []
+        self._synced_version = None
+        self._synced_at = None
+        self._invalidate_derived()
+
+    def _invalidate_derived(self):
+        # Everything below is derived from the cached grid in self._values
+        self._revision += 1
         self._records = []
-        self._summary = None
+        self._indexed_records = []
+        self._indexed_headers = []
+        self._records_by_row_number = {}
+        self._headers_by_column_number = {}
+        self._headers_by_column_name = {}
+        self._snapshot = None
+        self._context = None
+
+    def _build_indexes(self):
+        self._indexed_records = [{'row_number': index+2} | row for index, row in enumerate(self.records)]
+        self._indexed_headers = [{'column_name': header, 'column_number': index+1} for index, header in enumerate(self.headers)]
+        self._records_by_row_number = {record['row_number']: record for record in self._indexed_records}
+        self._headers_by_column_number = {header['column_number']: header for header in self._indexed_headers}
+        self._headers_by_column_name = {header['column_name']: header for header in self._indexed_headers}
+
+    def _set_cached_cell(self, row_number:int, column_number:int, value):
+        # Patch the in-memory table after a successful write instead of refetching it
+        if not self._values:
+            return
+        if row_number > len(self._values) or column_number > len(self._values[row_number-1]):
+            # The write grew the grid, which the cache can't reproduce (e.g. width and formatting), so refetch it
+            self.invalidate()
+            return
+        self._values[row_number-1][column_number-1] = value
+        if row_number == 1:
+            # Headers, records and their indexes are all keyed by the header row
+            self._invalidate_derived()
+            return
+        self._snapshot = None
+        self._revision += 1
+
+        if not self._records:
+            return
+        headers = self.headers
+        if 2 <= row_number <= len(self._records)+1 and 1 <= column_number <= len(headers):
+            column_name = headers[column_number-1]
+            self._records[row_number-2][column_name] = value
+            record = self._records_by_row_number.get(row_number)
+            if record is not None:
+                record[column_name] = value
+
+    def _append_cached_rows(self, rows: list[list]):
+        # Patch the in-memory table after a successful append instead of refetching it
+        if not self._values:
+            return
+        width = len(self._values[0])
+        new_values = [(['' if value is None else str(value) for value in row] + [''] * width)[:max(width, len(row))] for row in rows]
+        first_row_number = len(self._values) + 1
+        self._values.extend(new_values)
+        self._snapshot = None
+        self._context = None
+        self._revision += 1
+
+        if not self._records:
+            return
+        new_records = self._values_to_records([self._values[0]] + new_values)
+        self._records.extend(new_records)
+        if self._indexed_records:
+            for offset, record in enumerate(new_records):
+                indexed_record = {'row_number': first_row_number + offset} | record
+                self._indexed_records.append(indexed_record)
+                self._records_by_row_number[indexed_record['row_number']] = indexed_record
 
     @property
     def title(self) -> str:
@@ -38,9 +409,10 @@ class GoogleSheetWorksheet():
 
     @property
     def records(self) -> list[dict]:
+        # Records are derived from the cached grid so the worksheet is only downloaded once
         if not self._records:
             try:
-                self._records = self.worksheet.get_all_records()
+                self._records = self._values_to_records(self.values)
             except gspread.exceptions.GSpreadException as e:
                 print(str(e))
                 print(e.args[0])
@@ -49,8 +421,132 @@ class GoogleSheetWorksheet():
     @property
     def values(self) -> list[list]:
         if not self._values:
+            synced_at = datetime.now(UTC)
             self._values = self.worksheet.get_all_values()
+            self._synced_version = None
+            self._synced_at = synced_at
         return self._values
+
+    @property
+    def snapshot(self) -> 'WorksheetSnapshot':
+        """
+        A columnar copy of the worksheet with one typed NumPy array per column. Requires numpy (pandas/pyarrow for the exports).
+        """
+        if self._snapshot is None:
+            from .worksheet_snapshot import WorksheetSnapshot
+            self._snapshot = WorksheetSnapshot.from_values(self.values)
+        return self._snapshot
+
+    @staticmethod
+    def _values_to_records(values: list[list]) -> list[dict]:
+        # Mirrors gspread's get_all_records: first row is the header, values are numericised
+        if not values:
+            return []
+        headers = values[0]
+        if len(headers) != len(set(headers)):
+            raise gspread.exceptions.GSpreadException('the header row in the worksheet is not unique')
+        rows = [numericise_all((row + [''] * (len(headers) - len(row)))[:len(headers)]) for row in values[1:]]
+        return to_records(headers, rows)
+
+
+    def is_stale(self, version: dict=None) -> bool:
+        """
+        Checks whether the spreadsheet changed since the grid was fetched, using the Drive modifiedTime/version metadata
+
+        Args:
+            version (dict, optional): a version already fetched with GoogleSheet.get_version()
+
+        Returns:
+            bool: True if the cached grid may be out of date
+        """
+        self._tracks_versions = True
+        if not self._values:
+            return True
+        return not self._is_current(version or self.google_sheet.get_version())
+
+    @contextmanager
+    def _own_write(self):
+        # Our own write only moves the sync point forward if the grid was current right before it, so an edit made
+        # by someone else since the last fetch is never hidden. That check costs a Drive call, so it is only made
+        # once is_stale() or sync() are in use; otherwise the sync point stays put and the next check refetches.
+        was_current = self._tracks_versions and bool(self._values) and self._is_current(self.google_sheet.get_version())
+        yield
+        if was_current:
+            self._synced_version = None
+            self._synced_at = datetime.now(UTC)
+
+    def _is_current(self, version: dict) -> bool:
+        if self._synced_version is not None:
+            return version == self._synced_version
+        modified_time = version.get('modifiedTime')
+        if not modified_time or not self._synced_at:
+            return False
+        if datetime.fromisoformat(modified_time.replace('Z', '+00:00')) <= self._synced_at:
+            # Nothing changed since the grid was fetched or written, so this version is the one it matches
+            self._synced_version = version
+            return True
+        return False
+
+    def sync(self, changed_row_numbers: list[int]=None, append_only: bool=False, version: dict=None) -> bool:
+        """
+        Brings the cached grid up to date, re-fetching as little as possible
+
+        Args:
+            changed_row_numbers (list[int], optional): the row numbers known to have changed. Only these rows are re-fetched.
+            append_only (bool, optional): the worksheet only grows at the bottom, so only rows after the cached grid are fetched.
+            version (dict, optional): a version already fetched with GoogleSheet.get_version()
+
+        Returns:
+            bool: True if the cached grid was updated
+        """
+        self._tracks_versions = True
+        if not self._values:
+            self.values
+            return True
+
+        version = version or self.google_sheet.get_version()
+        if self._is_current(version):
+            return False
+
+        if changed_row_numbers:
+            self._fetch_rows(changed_row_numbers)
+        elif append_only:
+            self._fetch_rows_from(len(self._values) + 1)
+        else:
+            self._values = self.worksheet.get_all_values()
+
+        self._synced_version = version
+        self._synced_at = None
+        self._invalidate_derived()
+        return True
+
+    def _fetch_rows(self, row_numbers: list[int]):
+        # Group the rows into consecutive runs and fetch them all with one batch_get
+        runs = []
+        for row_number in sorted(set(row_numbers)):
+            if runs and row_number == runs[-1][1] + 1:
+                runs[-1][1] = row_number
+            else:
+                runs.append([row_number, row_number])
+
+        value_ranges = self.worksheet.batch_get([f'{start}:{end}' for start, end in runs])
+        for (start, end), value_range in zip(runs, value_ranges):
+            rows = list(value_range)
+            for offset, row_number in enumerate(range(start, end + 1)):
+                self._set_cached_row(row_number, rows[offset] if offset < len(rows) else [])
+
+    def _fetch_rows_from(self, row_number: int):
+        last_column = ''.join(c for c in rowcol_to_a1(1, max(self.worksheet.col_count, len(self.headers), 1)) if c.isalpha())
+        rows = self.worksheet.get(f'A{row_number}:{last_column}')
+        for offset, row in enumerate(rows):
+            self._set_cached_row(row_number + offset, list(row))
+
+    def _set_cached_row(self, row_number: int, row: list):
+        width = len(self._values[0]) if self._values else len(row)
+        row = row + [''] * (width - len(row))
+        while len(self._values) < row_number:
+            self._values.append([''] * width)
+        self._values[row_number - 1] = row
     
     @property
     def indexed_values(self) -> list[dict]:
@@ -66,33 +562,211 @@ class GoogleSheetWorksheet():
         return new_values
 
     @property
-    def indexed_records(self):
-        return [{'row_number': index+2} | row for index, row in enumerate(self.records)]
+    def indexed_records(self) -> list[dict]:
+        if not self._indexed_records:
+            self._build_indexes()
+        return self._indexed_records
+
+    @property
+    def indexed_headers(self) -> list[dict]:
+        if not self._indexed_headers:
+            self._build_indexes()
+        return self._indexed_headers
+
+    @property
+    def records_by_row_number(self) -> dict[int, dict]:
+        if not self._records_by_row_number:
+            self._build_indexes()
+        return self._records_by_row_number
+
+    @property
+    def headers_by_column_number(self) -> dict[int, dict]:
+        if not self._headers_by_column_number:
+            self._build_indexes()
+        return self._headers_by_column_number
+
+    @property
+    def headers_by_column_name(self) -> dict[str, dict]:
+        if not self._headers_by_column_name:
+            self._build_indexes()
+        return self._headers_by_column_name
+
 
     @property
-    def indexed_headers(self):
-        return [{'column_name': header, 'column_number': index+1} for index, header in enumerate(self.headers)]
+    def context(self) -> str:
+        if not self._context:
+            self._context = self.build_context()
+        return self._context
+
+    def build_context(self, max_exemplars:int=None) -> str:
+        """
+        Builds a compact description of the worksheet for prompts: the headers, a profile of each column and an evenly spaced sample of rows.
+        Its size depends on the number of columns, not the number of rows.
+
+        Args:
+            max_exemplars (int, optional): the maximum number of example rows to include. Defaults to `context_exemplars`.
+
+        Returns:
+            str: the worksheet context
+        """
+        max_exemplars = max_exemplars or self.context_exemplars
+        records = self.indexed_records
+
+        if len(records) <= max_exemplars:
+            exemplars = records
+        else:
+            step = len(records) / max_exemplars
+            exemplars = [records[int(i * step)] for i in range(max_exemplars)]
+
+        columns = []
+        for header in self.indexed_headers:
+            column_name = header['column_name']
+            filled_values = [record[column_name] for record in records if record.get(column_name) not in ('', None)]
+            examples = list(dict.fromkeys(str(value)[:100] for value in filled_values[:50]))[:3]
+            columns.append(header | {'filled_rows': len(filled_values), 'examples': examples})
+
+        info = {
+            'worksheet_title': self.worksheet.title,
+            'worksheet_id': self.worksheet.id,
+            'row_count': len(records) + 1,
+            'column_count': len(self.headers),
+        }
+        if self._summary:
+            info['summary'] = self._summary
+
+        return '\n'.join([
+            f'<worksheet_info>\n{info}\n</worksheet_info>',
+            f'<worksheet_columns>\n{columns}\n</worksheet_columns>',
+            f'<example_records count="{len(exemplars)}" of="{len(records)}">\n{exemplars}\n</example_records>',
+        ])
+
+    def get_context_cache(self, model:str, tools:list[types.Tool]=None) -> types.CachedContent:
+        """
+        Gets (or creates) an explicit Gemini context cache holding the worksheet context.
+        Returns None when caching is disabled or the context is too small to cache, in which case the context is sent inline.
+        A cache superseded by a changed context (e.g. after rows were appended) is deleted when its replacement is created.
+        """
+        if not self.use_context_cache:
+            return None
+
+        context = self.context
+        key = sha256(f'{model}|{tools}'.encode('utf-8')).hexdigest()
+        context_hash = sha256(context.encode('utf-8')).hexdigest()
+        with self._context_cache_lock:
+            cached_hash, cache = self._context_caches.get(key, (None, None))
+            if cached_hash == context_hash:
+                return cache
+            if cache:
+                self._delete_context_cache(cache)
+            try:
+                cache = self.genai_client.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=f'worksheet-{self.id}',
+                        contents=[context],
+                        tools=tools,
+                        ttl=self.context_cache_ttl
+                    )
+                )
+            except genai_errors.APIError as e:
+                print(f'Sending the worksheet context inline, could not create a context cache: {e}')
+                cache = None
+            self._context_caches[key] = (context_hash, cache)
+            return cache
+
+    def _delete_context_cache(self, cache: types.CachedContent):
+        try:
+            self.genai_client.caches.delete(name=cache.name)
+        except genai_errors.APIError as e:
+            print(f'Could not delete context cache {cache.name}: {e}')
+
+    def delete_context_caches(self):
+        with self._context_cache_lock:
+            for _, cache in self._context_caches.values():
+                if cache:
+                    self._delete_context_cache(cache)
+            self._context_caches = {}
+
+    def _generate_with_context(self, model:str, contents:list, config:types.GenerateContentConfig) -> types.GenerateContentResponse:
+        # Tools have to live on the cached content, not on the request that uses it
+        cache = self.get_context_cache(model=model, tools=config.tools)
+        if cache:
+            config = config.model_copy(update={'cached_content': cache.name, 'tools': None})
+        else:
+            contents = [self.context] + contents
+        return self.genai_client.models.generate_content(model=model, contents=contents, config=config)
 
 
     def get_row_by_index(self, row_index) -> dict:
-        row_records = list(filter(lambda x: x['row_index'] == row_index, self.indexed_records))
-        return row_records[0]
+        # Row index 0 is the header row, so row index n is row number n+1
+        return self.records_by_row_number[row_index+1]
     
     def get_row_by_row_number(self, row_number:int) -> dict:
-        row_records = list(filter(lambda x: x['row_number'] == row_number, self.indexed_records))
-        return row_records[0]
+        return self.records_by_row_number[row_number]
     
 
     def get_column_name_by_index(self, column_index) ->str:
-        header = list(filter(lambda x: x['column_index'] == column_index, self.indexed_headers))
-        return header[0]['column_name']
+        return self.headers_by_column_number[column_index+1]['column_name']
 
     def get_column_name_by_column_number(self, column_number) ->str:
-        header = list(filter(lambda x: x['column_number'] == column_number, self.indexed_headers))
-        return header[0]['column_name']
+        return self.headers_by_column_number[column_number]['column_name']
+
+    def get_column_number_by_column_name(self, column_name:str) -> int:
+        return self.headers_by_column_name[column_name]['column_number']
     
 
-    def get_cell_location_by_description(self, description:str) -> dict:
+    @staticmethod
+    def _normalize_description(description: str) -> str:
+        return re.sub(r'[^a-z0-9]+', ' ', str(description).lower()).strip()
+
+    def match_header(self, name_or_description: str) -> int:
+        """
+        Matches a column name locally, exactly or fuzzily, without calling a model
+
+        Args:
+            name_or_description (str): the column name or description
+
+        Returns:
+            int: the column number of the matching header, or None if no header matches with enough confidence
+        """
+        target = self._normalize_description(name_or_description)
+        column_numbers = {self._normalize_description(header['column_name']): header['column_number'] for header in self.indexed_headers}
+        if target in column_numbers:
+            return column_numbers[target]
+
+        scores = sorted(
+            ((SequenceMatcher(None, target, name).ratio(), column_number) for name, column_number in column_numbers.items()),
+            reverse=True
+        )
+        # Only trust a fuzzy match that is both close and clearly better than the runner-up
+        if scores and scores[0][0] >= self.header_match_threshold and (len(scores) == 1 or scores[0][0] - scores[1][0] >= 0.1):
+            return scores[0][1]
+        return None
+
+    def get_cell_location_by_description(self, description:str, a1:bool=False) -> dict:
+        """
+        Get the cell location using a description
+
+        Args:
+            description (str): a description of the cell, or an A1 reference such as "B7" when `a1` is True
+            a1 (bool, optional): resolve `description` as A1 notation locally instead of asking the model.
+                Off by default, since descriptions like "Q4" or "FY2024" also look like A1 references.
+
+        Returns
+            dict: the cell location {'row_number': int, 'column_number': int}
+        """
+        if a1:
+            match = re.fullmatch(r'\s*([A-Za-z]{1,3}[0-9]+)\s*', description)
+            if not match:
+                raise ValueError(f'Not an A1 cell reference: {description!r}')
+            row_number, column_number = a1_to_rowcol(match.group(1).upper())
+            return {'row_number': row_number, 'column_number': column_number}
+
+        key = ('cell', self._revision, self._normalize_description(description))
+        cached = self._resolution_cache.get(key)
+        if cached:
+            return dict(cached)
+
         res = self.google_sheet.drive_file.google_workspace_service.gc.genai_client.models.generate_content(
             model='gemini-2.5-flash',
             contents=[
@@ -115,18 +789,39 @@ class GoogleSheetWorksheet():
         )
 
         data = json.loads(res.text)
-        return data
+        self._resolution_cache.set(key, data)
+        return dict(data)
     
-    def get_cell_range_by_description(self, description:str) -> dict:
+    def get_cell_range_by_description(self, description:str, a1:bool=False) -> dict:
         """
         Get the cell range using a description
 
         Args:
-            description (str): a description of the range to retrieve
+            description (str): a description of the range to retrieve, or an A1 range such as "A2:C10" when `a1` is True
+            a1 (bool, optional): resolve `description` as A1 notation locally instead of asking the model.
+                Off by default, since descriptions like "Q4" or "FY2024" also look like A1 references.
 
         Returns
             dict: the cell range {'first_row_number': int, 'first_column_number': int, 'last_row_number': int, 'last_column_number': int}
         """
+        if a1:
+            match = re.fullmatch(r'\s*([A-Za-z]{1,3}[0-9]+):([A-Za-z]{1,3}[0-9]+)\s*', description)
+            if not match:
+                raise ValueError(f'Not an A1 range: {description!r}')
+            first_row_number, first_column_number = a1_to_rowcol(match.group(1).upper())
+            last_row_number, last_column_number = a1_to_rowcol(match.group(2).upper())
+            return {
+                'first_row_number': first_row_number,
+                'first_column_number': first_column_number,
+                'last_row_number': last_row_number,
+                'last_column_number': last_column_number
+            }
+
+        key = ('range', self._revision, self._normalize_description(description))
+        cached = self._resolution_cache.get(key)
+        if cached:
+            return dict(cached)
+
         res = self.google_sheet.drive_file.google_workspace_service.gc.genai_client.models.generate_content(
             model='gemini-2.5-flash',
             contents=[
@@ -151,13 +846,21 @@ class GoogleSheetWorksheet():
         )
 
         data = json.loads(res.text)
-        return data
+        self._resolution_cache.set(key, data)
+        return dict(data)
     
     def clear_range(self, first_row_number:int, first_column_number:int, last_row_number:int, last_column_number:int):
+        if self._write_buffer:
+            self._write_buffer.clear_range(first_row_number, first_column_number, last_row_number, last_column_number)
+            return
+
         cells = self.worksheet.range(first_row_number, first_column_number, last_row_number, last_column_number)
         for cell in cells:
             cell.value = ''
-        self.worksheet.update_cells(cells)
+        with self._own_write():
+            self.worksheet.update_cells(cells)
+            for cell in cells:
+                self._set_cached_cell(cell.row, cell.col, '')
 
 
 
@@ -165,11 +868,9 @@ class GoogleSheetWorksheet():
         rows = [i for i in range(first_row_number, last_row_number+1)]
         columns = [i for i in range(first_column_number, last_column_number+1)]
 
-        res = self.genai_client.models.generate_content(
+        res = self._generate_with_context(
             model=google_cloud_client.MODEL,
             contents=[
-                f'<worksheet_info>\n{self.info}\n<worksheet_info>',
-                f'<worksheet_records>\n{self.indexed_values}\n</worksheet_records>',
                 f'I will be adding conent for the content in the rows: {rows} and columns: {columns}.',
                 f'Generate a schema for the columns. The number of key should be equal to the number of columns that will be added ({len(columns)}).'
             ],
@@ -237,7 +938,19 @@ class GoogleSheetWorksheet():
 
     @property
     def info(self) -> dict:
-        return {
+        return self.get_info()
+
+    def get_info(self, include_summary: bool=False) -> dict:
+        """
+        Gets the worksheet metadata. The summary needs a model call, so it is only included when asked for or when it has already been computed.
+
+        Args:
+            include_summary (bool, optional): compute the summary if it is not available yet. Defaults to False.
+
+        Returns:
+            dict: the worksheet info
+        """
+        info = {
             # 'google_sheet_title': self.worksheet.spreadsheet.title,
             'worksheet_title': self.worksheet.title,
             'worksheet_index': self.worksheet.index,
@@ -245,15 +958,57 @@ class GoogleSheetWorksheet():
             # 'url': self.worksheet.url,
             'column_count': len(self.values[0]) if self.values else 0,
             'row_count': len(self.values) if self.values else 0,
-            'headers': self.summary,
+            'headers': self.values[0] if self.values else [],
         }
+        if include_summary or self._summary:
+            info['summary'] = self.summary
+        return info
     
     @property
     def summary(self) -> str:
         if not self._summary:
-            self._summary = self.get_summary()
+            self._summary = self.summarize_in_background().result()
         return self._summary
 
+    def summarize_in_background(self) -> Future:
+        """
+        Starts computing the summary on a background thread, if it is not already running
+
+        Returns:
+            Future: resolves to the summary
+        """
+        with self._summary_lock:
+            future = self._summary_future
+            # A failed summary is dropped rather than re-raised forever, so the next call tries again
+            if future is None or (future.done() and (future.cancelled() or future.exception() is not None)):
+                self._summary_future = _summary_executor.submit(self.get_persisted_summary)
+            return self._summary_future
+
+    def get_persisted_summary(self) -> str:
+        """
+        Gets the summary from the on-disk cache, keyed by a hash of the worksheet content, or computes and stores it
+        """
+        content_hash = sha256(f'{google_cloud_client.LITE_MODEL}|{json.dumps(self.values)}'.encode('utf-8')).hexdigest()
+        path = os.path.join(SUMMARY_CACHE_DIR, f'{content_hash}.txt')
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+
+        summary = self.get_summary()
+        # Written to a temporary file and renamed, so a concurrent reader never sees a partial summary
+        temp_path = None
+        try:
+            os.makedirs(SUMMARY_CACHE_DIR, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=SUMMARY_CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(summary)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f'Could not persist the worksheet summary: {e}')
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+        return summary
+
     def get_summary(self, prompt=None) -> str:
         res = self.genai_client.models.generate_content(
             model=google_cloud_client.LITE_MODEL,
@@ -282,12 +1037,23 @@ class GoogleSheetWorksheet():
         Returns:
             dict ({"index": column_index}): returns the index of the column
         '''
-
+        # Column lookups only depend on the headers, so cell edits don't evict them
+        key = ('column', tuple(self.headers), self._normalize_description(name_or_description))
+        cached = self._resolution_cache.get(key)
+        if cached is not None:
+            return cached
+
+        column_number = self.match_header(name_or_description)
+        if column_number:
+            self._resolution_cache.set(key, column_number-1)
+            return column_number-1
+
+        indexed_columns = [{'column_name': header['column_name'], 'index': header['column_number']-1} for header in self.indexed_headers]
         response = self.genai_client.models.generate_content(
             model=google_cloud_client.LITE_MODEL,
             contents=[
                 f'<worksheet_info>\n{self.info}\n<worksheet_info>',
-                f'<indexed_columns>\n{self.indexed_headers}\n</indexed_columns>',
+                f'<indexed_columns>\n{indexed_columns}\n</indexed_columns>',
                 f'Desired column name or description: {name_or_description}',
                 f'Based on the desired column name and description, what is the index of the desired column.'
             ],
@@ -301,7 +1067,9 @@ class GoogleSheetWorksheet():
             )
         )
 
-        return json.loads(response.text)["index"]
+        index = json.loads(response.text)["index"]
+        self._resolution_cache.set(key, index)
+        return index
 
 
     
@@ -316,21 +1084,38 @@ class GoogleSheetWorksheet():
         Returns:
             dict: the status of the operation
         """
+        if self._write_buffer:
+            self._write_buffer.clear_range(2, column_index+1, len(self.records)+1, column_index+1)
+            return {
+                'status': 'success',
+                'description': f'clearing the column with index {column_index} when the batch is committed'
+            }
+
         column_cells = self.get_column_range(column_index)[1:]
         for cell in column_cells:
             cell.value = ''
-        self.worksheet.update_cells(column_cells)
+        with self._own_write():
+            self.worksheet.update_cells(column_cells)
+            for cell in column_cells:
+                self._set_cached_cell(cell.row, cell.col, '')
         return {
             'status': 'success',
             'description': f'cleared the column with indedex {column_index}'
         }
 
 
-    def update_row(self, row_index: int, column_index: int, prompt=None):
-        
-        # Get the row gspread.Cell values
-        row_cells = self.get_row_range(row_index=row_index)
-        
+    def generate_cell_value(self, row_index: int, column_index: int, prompt=None) -> str:
+        """
+        Generates the content for a single cell without writing it to the worksheet
+
+        Args:
+            row_index (int): the index of the row the cell is in
+            column_index (int): the index of the column the cell is in
+            prompt (str, optional): instructions for generating the cell
+
+        Returns:
+            str: the generated cell content
+        """
         # Get the row as a dictionary
         row_record = self.get_row_by_index(row_index=row_index)
 
@@ -338,13 +1123,9 @@ class GoogleSheetWorksheet():
 
         prompt = prompt or f"Generate content for this column: {header}. Your reponse should only be the content that will be added to this cell."
 
-        cell_to_update = list(filter(lambda cell_: cell_.col == column_index+1, row_cells))[0]
-
-        response = self.genai_client.models.generate_content(
+        response = self._generate_with_context(
             model=google_cloud_client.MODEL,
             contents=[
-                f'<worksheet_info>\n{self.info}\n<worksheet_info>',
-                f'<worksheet_records>\n{self.indexed_records}\n</worksheet_records>',
                 f'<row_to_focus_on>\n{row_record}\n</row_to_focus_on>'
                 f'<column_to_update>\n{header}\n</column_to_update>',
                 f'{prompt}'
@@ -353,31 +1134,158 @@ class GoogleSheetWorksheet():
                 tools=[types.Tool(google_search=types.GoogleSearch())]
             )
         )
+        return response.text
 
-        cell_to_update.value = response.text
 
-        self.worksheet.update_cells([cell_to_update])
+    def update_row(self, row_index: int, column_index: int, prompt=None):
 
-        return response.text
+        if self._write_buffer:
+            text = self.generate_cell_value(row_index=row_index, column_index=column_index, prompt=prompt)
+            self._write_buffer.set_cell(row_index+1, column_index+1, text)
+            return text
+        
+        # Get the row gspread.Cell values
+        row_cells = self.get_row_range(row_index=row_index)
+
+        cell_to_update = list(filter(lambda cell_: cell_.col == column_index+1, row_cells))[0]
+
+        text = self.generate_cell_value(row_index=row_index, column_index=column_index, prompt=prompt)
+
+        cell_to_update.value = text
+
+        with self._own_write():
+            self.worksheet.update_cells([cell_to_update])
+            self._set_cached_cell(cell_to_update.row, cell_to_update.col, text)
 
+        return text
 
-    def update_all_rows(self, column_index:int, prompt:str):
+
+    def _wait_for_backoff(self):
+        with self._backoff_lock:
+            wait = self._backoff_until - monotonic()
+        if wait > 0:
+            sleep(wait)
+
+    def _generate_cell_value_with_backoff(self, row_index: int, column_index: int, prompt=None, max_attempts=6) -> str:
+        for attempt in range(max_attempts):
+            # Every worker honours the shared backoff so a 429 slows the whole pool down
+            self._wait_for_backoff()
+            try:
+                return self.generate_cell_value(row_index=row_index, column_index=column_index, prompt=prompt)
+            except genai_errors.APIError as e:
+                if e.code not in (429, 500, 503) or attempt == max_attempts - 1:
+                    raise e
+                delay = (2 ** attempt) + random()
+                print(f'Row {row_index}: model call failed with {e.code}, backing off for {delay:.1f} seconds')
+                with self._backoff_lock:
+                    self._backoff_until = max(self._backoff_until, monotonic() + delay)
+
+
+    def _flush_column_values(self, column_index: int, buffer: list[tuple[int, str]]):
+        # The buffer always holds consecutive rows, so it is written as one range
+        if not buffer:
+            return
+        first_row_number = buffer[0][0] + 1
+        last_row_number = buffer[-1][0] + 1
+        values = [[value] for _, value in buffer]
+        if self._write_buffer:
+            self._write_buffer.update_range(first_row_number, column_index+1, values)
+        else:
+            cell_range = f'{rowcol_to_a1(first_row_number, column_index+1)}:{rowcol_to_a1(last_row_number, column_index+1)}'
+            with self._own_write():
+                self.worksheet.batch_update([{'range': cell_range, 'values': values}])
+                for row_index, value in buffer:
+                    self._set_cached_cell(row_index+1, column_index+1, value)
+        self.last_flushed_row_index = buffer[-1][0]
+        buffer.clear()
+
+
+    def _update_all_rows_error(self, error: Exception) -> dict:
+        return {
+            'status': 'error',
+            'description': f'Stopped after row {self.last_flushed_row_index}: {error}',
+            'last_flushed_row_index': self.last_flushed_row_index
+        }
+
+    def update_all_rows(self, column_index:int, prompt:str, max_workers:int=None, flush_every:int=50, start_row_index:int=None):
         """
         Updates a single column for all rows
 
         Args:
             column_index (int): the index of the column to update
             prompt (str): instructions for updating the row
+            max_workers (int, optional): the number of concurrent model calls. When set, generated cells are buffered and written with one batch update every `flush_every` rows (or added to the write buffer inside batch()). Defaults to updating one row at a time.
+            flush_every (int, optional): the number of rows to buffer before writing them to the worksheet. Defaults to 50.
+            start_row_index (int, optional): the row index to start from, e.g. `last_flushed_row_index + 1` to resume an interrupted run. Defaults to 1 (the first row after the header).
 
         Return:
             After looping through each row and updating that column, the status of the operation
         """
-        for index in tqdm(range(1,len(self.records)+1)):
-            self.update_row(row_index=index, column_index=column_index, prompt=prompt)
+        start_row_index = start_row_index or 1
+        row_indexes = range(start_row_index, len(self.records)+1)
+        # Nothing is written yet, so a run that fails straight away resumes from start_row_index
+        self.last_flushed_row_index = start_row_index - 1
+
+        if not max_workers:
+            try:
+                for index in tqdm(row_indexes):
+                    self.update_row(row_index=index, column_index=column_index, prompt=prompt)
+                    self.last_flushed_row_index = index
+            except Exception as e:
+                return self._update_all_rows_error(e)
+
+            return {
+                'status': 'success',
+                'description': 'All of the rows have been updated',
+                'last_flushed_row_index': self.last_flushed_row_index
+            }
+
+        # Warm the shared caches before the workers read them
+        self.indexed_records
+        self.context
+
+        buffer: list[tuple[int, str]] = []
+        pending = iter(row_indexes)
+        futures = {}
+        flushing = False
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            # Keep a bounded window of model calls in flight ahead of the writer
+            for row_index in islice(pending, max_workers * 2):
+                futures[row_index] = executor.submit(self._generate_cell_value_with_backoff, row_index, column_index, prompt)
+
+            for row_index in tqdm(row_indexes):
+                value = futures.pop(row_index).result()
+                next_row_index = next(pending, None)
+                if next_row_index is not None:
+                    futures[next_row_index] = executor.submit(self._generate_cell_value_with_backoff, next_row_index, column_index, prompt)
+
+                buffer.append((row_index, value))
+                if len(buffer) >= flush_every:
+                    flushing = True
+                    self._flush_column_values(column_index, buffer)
+                    flushing = False
+
+            flushing = True
+            self._flush_column_values(column_index, buffer)
+
+        except Exception as e:
+            for future in futures.values():
+                future.cancel()
+            # Save the rows generated so far, unless writing them is what failed
+            if not flushing:
+                try:
+                    self._flush_column_values(column_index, buffer)
+                except Exception as flush_error:
+                    print(f'Could not write the buffered rows: {flush_error}')
+            return self._update_all_rows_error(e)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
         return {
             'status': 'success',
-            'description': 'All of the rows have been updated'
+            'description': 'All of the rows have been updated',
+            'last_flushed_row_index': self.last_flushed_row_index
         }
 
     def update_multiple_columns_of_row(self, row_index:int, column_indexes:list[int], prompt:str):
@@ -388,7 +1296,7 @@ class GoogleSheetWorksheet():
         # Get the row as a dictionary
         row_record = self.get_row_by_index(row_index=row_index)
 
-        headers = list(filter(lambda x: x['column_index'] in column_indexes, self.indexed_headers))
+        headers = [self.headers_by_column_number[column_index+1] for column_index in column_indexes]
         print(headers)
         return
 
@@ -418,26 +1326,15 @@ class GoogleSheetWorksheet():
 
 
     def add_additional_row(self):
-        schema = {
-            'type': 'object',
-            'properties': {},
-            'required': self.headers
-        }
-
-        for header in self.headers:
-            schema['properties'][header] = {'type': 'string'}
-        
-        response = self.genai_client.models.generate_content(
+        response = self._generate_with_context(
             model=google_cloud_client.MODEL,
             contents=[
-                f'<worksheet_info>\n{self.info}\n<worksheet_info>',
-                f'<worksheet_records>\n{self.records}\n</worksheet_records>',
                 f'Create a new record'
             ],
             config=types.GenerateContentConfig(
                 # tools=[types.Tool(google_search=types.GoogleSearch())],
                 response_mime_type='application/json',
-                response_schema=schema,
+                response_schema=self.schema,
                 max_output_tokens=64000
             )
         )
@@ -447,25 +1344,120 @@ class GoogleSheetWorksheet():
         for header in self.headers:
             row.append(record.get(header))
 
-        self.worksheet.append_row(row)
+        if self._write_buffer:
+            self._write_buffer.append_row(row)
+            return
 
+        with self._own_write():
+            self.worksheet.append_row(row)
+            self._append_cached_rows([row])
 
-    def add_additional_rows(self, number_of_rows:int):
+
+    def _row_key(self, row: list) -> tuple:
+        # Normalised row used to detect duplicate records
+        return tuple(str(value).strip().lower() for value in row)
+
+    def generate_additional_records(self, number_of_records:int, exclude: list[dict]=None) -> list[dict]:
+        """
+        Generates several new records in a single model call
+
+        Args:
+            number_of_records (int): the number of records to generate
+            exclude (list[dict], optional): records generated earlier that should not be repeated
+
+        Returns:
+            list[dict]: the generated records
+        """
+        contents = [f'Create {number_of_records} new records. Each record should be different from the existing records and from each other.']
+        if exclude:
+            contents.insert(0, f'<records_already_added>\n{exclude}\n</records_already_added>')
+
+        response = self._generate_with_context(
+            model=google_cloud_client.MODEL,
+            contents=contents,
+            config=types.GenerateContentConfig(
+                response_mime_type='application/json',
+                response_schema={
+                    'type': 'array',
+                    'items': self.schema,
+                    'minItems': number_of_records,
+                    'maxItems': number_of_records
+                },
+                max_output_tokens=64000
+            )
+        )
+        return json.loads(response.text)
+
+
+    def add_additional_rows(self, number_of_rows:int, records_per_request:int=None, max_requests:int=None, flush_every:int=20):
         '''
         Adds aditional rows to the spreadsheet
 
         Args:
             number_of_rows (int): the number of rows that should be added
+            records_per_request (int, optional): when set, generates up to this many records per model call, drops duplicates of existing rows and writes all of the new rows with one append. Defaults to one record per call.
+            max_requests (int, optional): the maximum number of model calls when generating several records per call. Defaults to twice the number of calls needed.
+            flush_every (int, optional): with one record per call, the number of rows appended at a time. Defaults to 20.
+
+        Rows generated before a failing model call are still written before the error is raised.
 
         Returns:
             dict: status of the operation
         '''
-        for _ in tqdm(range(number_of_rows)):
-            self.add_additional_row()
+        if not records_per_request:
+            if self._write_buffer:
+                for _ in tqdm(range(number_of_rows)):
+                    self.add_additional_row()
+            else:
+                # Rows are appended `flush_every` at a time, so the calls in between share the same worksheet context
+                buffer = self._write_buffer = WorksheetWriteBuffer(self)
+                try:
+                    for position in tqdm(range(number_of_rows)):
+                        self.add_additional_row()
+                        if (position + 1) % flush_every == 0:
+                            buffer.commit()
+                finally:
+                    # Also on error, so the rows already generated (and paid for) are kept
+                    self._write_buffer = None
+                    buffer.commit()
+
+            return {
+                'status': 'success',
+                'description': f'{number_of_rows} have been added to the spreadsheet'
+            }
+
+        headers = self.headers
+        seen = {self._row_key([record.get(header) for header in headers]) for record in self.records}
+        new_records: list[dict] = []
+        new_rows: list[list] = []
+        max_requests = max_requests or 2 * -(-number_of_rows // records_per_request)
+
+        try:
+            for _ in tqdm(range(max_requests)):
+                remaining = number_of_rows - len(new_rows)
+                if remaining <= 0:
+                    break
+                records = self.generate_additional_records(min(records_per_request, remaining), exclude=new_records)
+                for record in records[:remaining]:
+                    row = [record.get(header) for header in headers]
+                    key = self._row_key(row)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    new_records.append(record)
+                    new_rows.append(row)
+        finally:
+            # Also on error, so the rows already generated (and paid for) are kept
+            if new_rows and self._write_buffer:
+                self._write_buffer.append_rows(new_rows)
+            elif new_rows:
+                with self._own_write():
+                    self.worksheet.append_rows(new_rows)
+                    self._append_cached_rows(new_rows)
 
         return {
-            'status': 'success',
-            'description': f'{number_of_rows} have been added to the spreadsheet'
+            'status': 'success' if len(new_rows) == number_of_rows else 'partial',
+            'description': f'{len(new_rows)} have been added to the spreadsheet'
         }
     
     def delete_row(self, row_index:int):
@@ -478,7 +1470,11 @@ class GoogleSheetWorksheet():
         Returns:
             dict: status of the operation
         '''
-        self.worksheet.delete_rows(row_index+1)
+        if self._write_buffer:
+            self._write_buffer.delete_rows(row_index+1)
+        else:
+            self.worksheet.delete_rows(row_index+1)
+            self.invalidate()
         
         return {
             'status': 'success',
@@ -496,7 +1492,11 @@ class GoogleSheetWorksheet():
         Returns:
             dict: status of the operation
         '''
-        self.worksheet.delete_rows(start_index + 1, end_index + 1)
+        if self._write_buffer:
+            self._write_buffer.delete_rows(start_index + 1, end_index + 1)
+        else:
+            self.worksheet.delete_rows(start_index + 1, end_index + 1)
+            self.invalidate()
         
         return {
             'status': 'success',
@@ -505,18 +1505,14 @@ class GoogleSheetWorksheet():
 
 
 
-    def append_row(self, worksheet:gspread.Worksheet, data: list, attempt=1):
-        try:
-            worksheet.append_row(data)
-        except gspread.exceptions.APIError as e:
-            if attempt < 4:
-                sleep_time = 15
-                print(f'Attempt {attempt} failed, sleeping for {15} seconds')
-                sleep(sleep_time)
-                self.append_row(worksheet=worksheet, data=data, attempt=attempt+1)
-                self._records = []
-            else:
-                raise e
+    def append_row(self, worksheet:gspread.Worksheet, data: list):
+        if self._write_buffer and worksheet is self.worksheet:
+            self._write_buffer.append_row(data)
+            return
+
+        # Retries and pacing are handled by the GoogleSheet's QuotaHTTPClient
+        worksheet.append_row(data)
+        self.invalidate()
 
 
 
@@ -554,12 +1550,41 @@ class GoogleSheet():
     @property
     def title(self):
         return self.spreadsheet.title
+
+    def get_version(self) -> dict:
+        """
+        Gets the Drive modifiedTime and version of the spreadsheet. This is a cheap metadata call used to detect changes without downloading any cells.
+
+        Returns:
+            dict: {'modifiedTime': str, 'version': str}
+        """
+        return self.drive_file.google_workspace_service.drive.files().get(fileId=self.id, fields='modifiedTime,version').execute()
+
+    def sync(self) -> list[GoogleSheetWorksheet]:
+        """
+        Re-fetches the cached worksheets if the spreadsheet changed since they were downloaded
+
+        Returns:
+            list[GoogleSheetWorksheet]: the worksheets that were updated
+        """
+        cached_worksheets = [worksheet for worksheet in self.worksheets if worksheet._values]
+        if not cached_worksheets:
+            return []
+        version = self.get_version()
+        return [worksheet for worksheet in cached_worksheets if worksheet.sync(version=version)]
     
     @property
     def gs(self):
         if not self._gs:
-            self._gs = gspread.Client(self.drive_file.google_workspace_service.credentials)
+            self._gs = gspread.Client(self.drive_file.google_workspace_service.credentials, http_client=QuotaHTTPClient)
         return self._gs
+
+    @property
+    def quota_usage(self) -> dict:
+        """
+        Sheets API requests, retries and seconds spent throttled for this spreadsheet in this process
+        """
+        return quota_manager.usage(self.id)
     
     @property
     def spreadsheet(self) -> gspread.Spreadsheet:
@@ -584,7 +1609,31 @@ class GoogleSheet():
     
     @property
     def worksheets_info(self) -> list[dict]:
-        return [worksheet.info for worksheet in self.worksheets]
+        return self.get_worksheets_info()
+
+    def get_worksheets_info(self, include_summary: bool=False) -> list[dict]:
+        """
+        Gets the info of every worksheet
+
+        Args:
+            include_summary (bool, optional): include the worksheet summaries. They are computed concurrently across worksheets. Defaults to False.
+
+        Returns:
+            list[dict]: the info of each worksheet
+        """
+        if include_summary:
+            self.summarize_worksheets()
+        return [worksheet.get_info(include_summary=include_summary) for worksheet in self.worksheets]
+
+    def summarize_worksheets(self) -> dict[str, str]:
+        """
+        Summarizes every worksheet concurrently, reusing summaries persisted for unchanged content
+
+        Returns:
+            dict: {worksheet title: summary}
+        """
+        futures = {worksheet.title: worksheet.summarize_in_background() for worksheet in self.worksheets}
+        return {title: future.result() for title, future in futures.items()}
     
     def get_worksheet_by_title(self, title:str) -> GoogleSheetWorksheet:
         filtered_titles = list(filter(lambda worksheet: worksheet.title == title, self.worksheets))
@@ -623,7 +1672,23 @@ class GoogleSheet():
         return self._worksheet
     
 
+    def __enter__(self) -> 'GoogleSheet':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Deletes the Gemini context caches of every worksheet loaded from this spreadsheet
+        """
+        for worksheet in {id(worksheet): worksheet for worksheet in self._worksheets + [self._worksheet] if worksheet}.values():
+            worksheet.close()
+
     def refresh_spreadsheet(self, worksheet_title=None):
+        # The worksheet objects are replaced, so their context caches would be orphaned
+        self.close()
         self._worksheets = []
         self._worksheet = None
         self._records = []
@@ -668,16 +1733,7 @@ class GoogleSheet():
         return GoogleSheetWorksheet(google_sheet=self, worksheet=worksheet)
 
 
-    def download_google_spreadsheet_as_csv(self) -> io.BytesIO:
+    def download_google_spreadsheet_as_csv(self, destination=None) -> io.BytesIO:
         if self.drive_file.mime_type != 'application/vnd.google-apps.spreadsheet':
             raise ValueError("File is not a Google Spreadsheet.")
-        request = self.drive_file.google_workspace_service.drive.files().export_media(fileId=self.id, mimeType='text/csv')
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-            print("Download %d%%." % int(status.progress() * 100))
-        
-        fh.seek(0)
-        return fh
\ No newline at end of file
+        return self.drive_file.google_workspace_service.download_file(self.id, mime_type='text/csv', destination=destination, use_cache=True)
\ No newline at end of file
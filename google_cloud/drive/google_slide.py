@@ -1,7 +1,6 @@
 from googleapiclient.discovery import build, Resource
 from google_cloud import GoogleCloudService
 import mistune
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 import io
 from googleapiclient.errors import HttpError
 from .google_drive_service import GoogleDriveFile
@@ -55,18 +54,60 @@ class PresentationPage:
         self._thumbnail: io.BytesIO = None
         self._pdf: io.BytesIO = None
 
+        # Element wrappers and their indexes are built once, on first use
+        self._page_elements: list[PresentationPageElement] = None
+        self._elements_by_id: dict[str, PresentationPageElement] = None
+        self._elements_by_placeholder_type: dict[str, list[PresentationPageElement]] = None
+
 
     @property
     def id(self):
         return self._kwargs.get('objectId', None)
 
+    @property
+    def name(self) -> str:
+        # Layouts are named by layoutProperties, e.g. 'TITLE_AND_BODY'
+        return (self._kwargs.get('layoutProperties') or {}).get('name', None)
+
+    @property
+    def display_name(self) -> str:
+        return (self._kwargs.get('layoutProperties') or {}).get('displayName', None)
+
     @property
     def page_elements(self) -> list[PresentationPageElement]:
-        return [PresentationPageElement(presentation_page=self, **page) for page in self._kwargs.get('pageElements', [])]
+        if self._page_elements is None:
+            self._page_elements = [PresentationPageElement(presentation_page=self, **page) for page in self._kwargs.get('pageElements', [])]
+            self._elements_by_id = {element.id: element for element in self._page_elements}
+            self._elements_by_placeholder_type = {}
+            for element in self._page_elements:
+                if element.placeholder:
+                    self._elements_by_placeholder_type.setdefault(element.placeholder_type, []).append(element)
+        return self._page_elements
     
     @property
-    def placeholder_elements(self):
-        return [page for page in self.page_elements if page.placeholder]
+    def placeholder_elements(self) -> list[PresentationPageElement]:
+        return [element for element in self.page_elements if element.placeholder]
+
+    @property
+    def elements_by_id(self) -> dict[str, PresentationPageElement]:
+        if self._elements_by_id is None:
+            self.page_elements
+        return self._elements_by_id
+
+    @property
+    def elements_by_placeholder_type(self) -> dict[str, list[PresentationPageElement]]:
+        if self._elements_by_placeholder_type is None:
+            self.page_elements
+        return self._elements_by_placeholder_type
+
+    def get_element(self, object_id: str) -> PresentationPageElement:
+        return self.elements_by_id.get(object_id)
+
+    def get_placeholders(self, placeholder_type: str) -> list[PresentationPageElement]:
+        """
+        Gets the page's placeholders of a type, e.g. 'TITLE' or 'BODY'
+        """
+        return self.elements_by_placeholder_type.get(placeholder_type, [])
     
 
     @property
@@ -136,6 +177,14 @@ class Presentation:
         self._pdf: io.BytesIO = None
         self._layout_contents: list[types.Part] = None
 
+        # Page wrappers are built once, so their thumbnail caches survive between accesses
+        self._masters: list[PresentationPage] = None
+        self._notes_master: PresentationPage = None
+        self._slides: list[PresentationPage] = None
+        self._layouts: list[PresentationPage] = None
+        self._pages_by_id: dict[str, PresentationPage] = None
+        self._layouts_by_name: dict[str, PresentationPage] = None
+
     @classmethod
     def from_drive_file(cls, drive_file: GoogleDriveFile, **kwargs):
         presentation = drive_file.google_workspace_service.slides.presentations().get(presentationId=drive_file.id).execute()
@@ -155,22 +204,68 @@ class Presentation:
     
     @property
     def masters(self) -> list[PresentationPage]:
-        masters = self._kwargs.get('masters', [])
-        return [PresentationPage(presentation=self, **master) for master in masters]
+        if self._masters is None:
+            self._masters = [PresentationPage(presentation=self, **master) for master in self._kwargs.get('masters', [])]
+        return self._masters
     
     @property
     def notesMaster(self) -> PresentationPage:
-        notes_master = self._kwargs.get('notesMaster', None)
-        return PresentationPage(presentation=self, **notes_master) if notes_master else None
+        if self._notes_master is None:
+            notes_master = self._kwargs.get('notesMaster', None)
+            self._notes_master = PresentationPage(presentation=self, **notes_master) if notes_master else None
+        return self._notes_master
     
     @property
     def slides(self) -> list[PresentationPage]:
-        slides = self._kwargs.get('slides', [])
-        return [PresentationPage(presentation=self, **slide) for slide in slides]
+        if self._slides is None:
+            self._slides = [PresentationPage(presentation=self, **slide) for slide in self._kwargs.get('slides', [])]
+        return self._slides
     
     @property
     def layouts(self) -> list[PresentationPage]:
-        return [PresentationPage(presentation=self, **layout) for layout in self._kwargs.get('layouts', [])]
+        if self._layouts is None:
+            self._layouts = [PresentationPage(presentation=self, **layout) for layout in self._kwargs.get('layouts', [])]
+        return self._layouts
+
+    @property
+    def pages_by_id(self) -> dict[str, PresentationPage]:
+        if self._pages_by_id is None:
+            pages = self.masters + self.layouts + self.slides + ([self.notesMaster] if self.notesMaster else [])
+            self._pages_by_id = {page.id: page for page in pages}
+        return self._pages_by_id
+
+    @property
+    def layouts_by_name(self) -> dict[str, PresentationPage]:
+        """
+        Layouts by their display name (e.g. 'Title and body') and their name (e.g. 'TITLE_AND_BODY')
+        """
+        if self._layouts_by_name is None:
+            layouts_by_name = {}
+            for layout in self.layouts:
+                for name in (layout.name, layout.display_name):
+                    if name:
+                        layouts_by_name.setdefault(name, layout)
+            self._layouts_by_name = layouts_by_name
+        return self._layouts_by_name
+
+    def get_page(self, page_id: str) -> PresentationPage:
+        return self.pages_by_id.get(page_id)
+
+    def get_layout_by_name(self, name: str) -> PresentationPage:
+        return self.layouts_by_name.get(name)
+
+    def refresh(self):
+        """
+        Refetches the presentation, e.g. after slides were created, and drops the page wrappers built from it
+        """
+        self._kwargs = self.drive_file.google_workspace_service.slides.presentations().get(presentationId=self.id).execute()
+        self._masters = None
+        self._notes_master = None
+        self._slides = None
+        self._layouts = None
+        self._pages_by_id = None
+        self._layouts_by_name = None
+        self._layout_contents = None
     
     @property
     def layout_id_enum(self) -> list[str]:
@@ -182,8 +277,7 @@ class Presentation:
         if not self._layout_contents:
             contents = []
             for layout in self.layouts:
-                layout_properties: dict = layout._kwargs.get('layoutProperties', {})
-                display_name = layout_properties.get('displayName', None)
+                display_name = layout.display_name
                 contents.append(types.Content(
                     parts = [
                         types.Part.from_text(text=f'Layout Name: {display_name}'),
@@ -200,22 +294,16 @@ class Presentation:
     @property
     def pdf(self) -> io.BytesIO:
         if not self._pdf:
-            request = self.drive_file.google_workspace_service.drive.files().export_media(fileId=self.id, mimeType='application/pdf')
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-                print("Download %d%%." % int(status.progress() * 100))
-            
-            fh.seek(0)
-            self._pdf = fh
+            self._pdf = self.drive_file.google_workspace_service.download_file(self.id, mime_type='application/pdf', use_cache=True)
         self._pdf.seek(0)
         return self._pdf
     
 
     def get_layout_page(self, layout_id:str) -> 'PresentationPage':
-        return [layout for layout in self.layouts if layout.id == layout_id][0]
+        layout = self.pages_by_id.get(layout_id)
+        if layout is None or layout._kwargs.get('pageType', 'LAYOUT') != 'LAYOUT':
+            raise KeyError(f'No layout with id {layout_id}')
+        return layout
     
     
     def generate_slides_from_layouts(self, prompt:str):
@@ -0,0 +1,206 @@
+import mistune
+
+HEADING_STYLES = {level: f'HEADING_{level}' for level in range(1, 7)}
+CODE_FONT = {'fontFamily': 'Courier New'}
+QUOTE_INDENT = {'magnitude': 36, 'unit': 'PT'}
+RULE_BORDER = {'width': {'magnitude': 1, 'unit': 'PT'}, 'padding': {'magnitude': 4, 'unit': 'PT'}, 'dashStyle': 'SOLID',
+               'color': {'color': {'rgbColor': {'red': 0.7, 'green': 0.7, 'blue': 0.7}}}}
+# Fields reset on everything inserted, so the new text doesn't inherit the style at the insertion point
+PARAGRAPH_FIELDS = 'namedStyleType,indentStart,indentFirstLine,borderBottom'
+TEXT_FIELDS = 'bold,italic,strikethrough,underline,link,weightedFontFamily'
+BULLET_PRESETS = {False: 'BULLET_DISC_CIRCLE_SQUARE', True: 'NUMBERED_DECIMAL_ALPHA_ROMAN'}
+
+_parse = mistune.create_markdown(renderer=None, plugins=['strikethrough', 'table'])
+
+
+class _RequestBuilder():
+    # Lays the Markdown out as one text, recording paragraph, text and list styles by offset into it
+    def __init__(self):
+        self.parts: list[str] = []
+        self.length = 0
+        self.paragraph_styles: list[tuple[int, int, dict]] = []
+        self.text_styles: list[tuple[int, int, dict]] = []
+        self.lists: list[tuple[int, int, str]] = []
+        # Later paragraphs of a list item, which keep the item's indent but get no bullet of their own
+        self.continuations: list[tuple[int, int]] = []
+
+    def write(self, text: str, style: dict = None):
+        if not text:
+            return
+        if style:
+            self.text_styles.append((self.length, self.length + len(text), style))
+        self.parts.append(text)
+        self.length += len(text)
+
+    def paragraph(self, children: list, paragraph_style: dict = None, depth: int = 0, style: dict = None):
+        start = self.length
+        self.write('\t' * depth)
+        self.inline(children, style or {})
+        self.write('\n')
+        if paragraph_style:
+            self.paragraph_styles.append((start, self.length, paragraph_style))
+
+    def inline(self, children: list, style: dict):
+        for child in children:
+            kind = child['type']
+            if kind == 'text':
+                self.write(child['raw'], style)
+            elif kind == 'strong':
+                self.inline(child['children'], style | {'bold': True})
+            elif kind == 'emphasis':
+                self.inline(child['children'], style | {'italic': True})
+            elif kind == 'strikethrough':
+                self.inline(child['children'], style | {'strikethrough': True})
+            elif kind == 'codespan':
+                self.write(child['raw'], style | {'weightedFontFamily': CODE_FONT})
+            elif kind in ('link', 'image'):
+                # Images become their alt text, linked to the image
+                self.inline(child.get('children') or [{'type': 'text', 'raw': child['attrs']['url']}], style | {'link': {'url': child['attrs']['url']}})
+            elif kind == 'softbreak':
+                self.write(' ', style)
+            elif kind == 'linebreak':
+                # A vertical tab is a line break within the paragraph in Docs
+                self.write('\v', style)
+            elif 'children' in child:
+                self.inline(child['children'], style)
+            elif 'raw' in child:
+                self.write(child['raw'], style)
+
+    def blocks(self, nodes: list, depth: int = 0, paragraph_style: dict = None):
+        for node in nodes:
+            kind = node['type']
+            if kind == 'heading':
+                self.paragraph(node['children'], {'namedStyleType': HEADING_STYLES[min(node['attrs']['level'], 6)]})
+            elif kind in ('paragraph', 'block_text'):
+                self.paragraph(node['children'], paragraph_style, depth)
+            elif kind == 'block_quote':
+                self.blocks(node['children'], depth, (paragraph_style or {}) | {'indentStart': QUOTE_INDENT, 'indentFirstLine': QUOTE_INDENT})
+            elif kind == 'block_code':
+                for line in node['raw'].rstrip('\n').split('\n'):
+                    self.paragraph([{'type': 'text', 'raw': line}], paragraph_style, depth, {'weightedFontFamily': CODE_FONT})
+            elif kind == 'block_html' or ('raw' in node and 'children' not in node):
+                # Raw HTML (and anything else without a Docs equivalent) is kept as plain text, one paragraph per line
+                for line in node['raw'].strip('\n').split('\n'):
+                    self.paragraph([{'type': 'text', 'raw': line}], paragraph_style, depth)
+            elif kind == 'thematic_break':
+                self.paragraph([], {'borderBottom': RULE_BORDER})
+            elif kind == 'list':
+                start = self.length
+                for item in node['children']:
+                    self._list_item(item, depth)
+                if depth == 0:
+                    self.lists.append((start, self.length, BULLET_PRESETS[bool(node['attrs'].get('ordered'))]))
+            elif kind == 'table':
+                self._table(node)
+            elif 'children' in node:
+                self.blocks(node['children'], depth, paragraph_style)
+
+    def _list_item(self, item: dict, depth: int):
+        # Nested lists are indented with leading tabs, which createParagraphBullets turns into nesting levels
+        first = True
+        for child in item['children']:
+            if child['type'] == 'list':
+                for nested_item in child['children']:
+                    self._list_item(nested_item, depth + 1)
+                continue
+            start = self.length
+            if child['type'] in ('paragraph', 'block_text'):
+                self.paragraph(child['children'], None, depth)
+            else:
+                self.blocks([child], depth)
+            if self.length == start:
+                continue
+            if not first:
+                self.continuations.append((start, self.length))
+            first = False
+
+    def _table(self, node: dict):
+        # Docs tables need their cell indices resolved after insertTable, so Markdown tables become one line per row
+        for section in node['children']:
+            rows = [section] if section['type'] == 'table_head' else section['children']
+            for row in rows:
+                cells = []
+                for position, cell in enumerate(row['children']):
+                    if position:
+                        cells.append({'type': 'text', 'raw': ' | '})
+                    cells.append({'type': 'strong', 'children': cell['children']} if cell['attrs'].get('head') else cell)
+                self.paragraph(cells)
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+
+def markdown_to_requests(markdown: str, index: int = 1, segment_id: str = None) -> list[dict]:
+    """
+    Compiles Markdown straight into Docs API requests that insert it, styled, at an index.
+
+    Headings, paragraphs, emphasis, strikethrough, code, links, block quotes, horizontal rules and (nested) lists
+    map to Docs paragraph styles, text styles and bullets; later paragraphs of a list item keep its indent without a
+    bullet. Tables are written one row per line, and raw HTML blocks as plain text. The text is inserted
+    with a single insertText, then styled; the index should be at the start of a paragraph.
+
+    Args:
+        markdown (str): the Markdown
+        index (int): where to insert it
+        segment_id (str): the header, footer or footnote to insert into, or None for the body
+
+    Returns:
+        list[dict]: the requests, to be sent in one documents.batchUpdate
+    """
+    builder = _RequestBuilder()
+    builder.blocks(_parse(markdown))
+    if not builder.length:
+        return []
+
+    segment = {'segmentId': segment_id} if segment_id else {}
+    absolute = lambda start, end: {'startIndex': index + start, 'endIndex': index + end} | segment
+    requests = [
+        {'insertText': {'location': {'index': index} | segment, 'text': builder.text}},
+        {'updateParagraphStyle': {'range': absolute(0, builder.length), 'paragraphStyle': {'namedStyleType': 'NORMAL_TEXT'}, 'fields': PARAGRAPH_FIELDS}},
+        {'deleteParagraphBullets': {'range': absolute(0, builder.length)}},
+        {'updateTextStyle': {'range': absolute(0, builder.length), 'textStyle': {}, 'fields': TEXT_FIELDS}},
+    ]
+    for start, end, style in builder.paragraph_styles:
+        requests.append({'updateParagraphStyle': {'range': absolute(start, end), 'paragraphStyle': style, 'fields': ','.join(style)}})
+    for start, end, style in builder.text_styles:
+        requests.append({'updateTextStyle': {'range': absolute(start, end), 'textStyle': style, 'fields': ','.join(style)}})
+    # Bullets last and bottom-up: they remove the leading tabs, which shifts everything after them
+    for start, end, preset in sorted(builder.lists, reverse=True):
+        requests.append({'createParagraphBullets': {'range': absolute(start, end), 'bulletPreset': preset}})
+    # Continuation paragraphs stay in the list (so numbering carries on) but lose their bullet, keeping their indent.
+    # Their indices are shifted back by the tabs createParagraphBullets removed before them.
+    text = builder.text
+    tabs = [(line_start, len(line) - len(line.lstrip('\t')))
+            for start, end, _ in builder.lists
+            for line_start, line in _lines(text, start, end)]
+    removed_before = lambda offset: sum(min(count, max(0, offset - line_start)) for line_start, count in tabs)
+    for start, end in builder.continuations:
+        requests.append({'deleteParagraphBullets': {'range': absolute(start - removed_before(start), end - removed_before(end))}})
+    return requests
+
+
+def _lines(text: str, start: int, end: int):
+    # (offset, line) for each line of text[start:end]
+    offset = start
+    for line in text[start:end].split('\n'):
+        yield offset, line
+        offset += len(line) + 1
+
+
+def inserted_length(requests: list[dict]) -> int:
+    """
+    Gets the number of characters that requests from markdown_to_requests add to the document, i.e. the inserted
+    text minus the leading tabs that createParagraphBullets removes
+    """
+    if not requests:
+        return 0
+    insert = requests[0]['insertText']
+    text, index = insert['text'], insert['location']['index']
+    removed = 0
+    for request in requests:
+        bullets = request.get('createParagraphBullets')
+        if bullets:
+            lines = text[bullets['range']['startIndex'] - index:bullets['range']['endIndex'] - index].split('\n')
+            removed += sum(len(line) - len(line.lstrip('\t')) for line in lines)
+    return len(text) - removed
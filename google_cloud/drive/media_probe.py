@@ -0,0 +1,116 @@
+import io
+import struct
+from typing import Callable
+
+from pymediainfo import MediaInfo
+
+# Enough for the header of most containers, and for the whole moov box of short "fast start" MP4s
+HEAD_SIZE = 256 * 1024
+# Don't fetch a moov box larger than this just to read a resolution
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+# ISO base media (MP4, MOV, 3GP) boxes that only contain other boxes, on the way to the sample description
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+
+def probe_resolution(read_range: Callable[[int, int], bytes], size: int, head_size: int = HEAD_SIZE) -> tuple[int, int]:
+    """
+    Reads a video's width and height from its container metadata, fetching only the byte ranges that hold it.
+
+    For MP4/MOV files, the top-level boxes are walked by their headers alone and only the moov box is fetched,
+    wherever it is (at the start for "fast start" files, usually at the end otherwise). Other containers are
+    handed to MediaInfo with just the first `head_size` bytes.
+
+    Args:
+        read_range (callable): read_range(start, end) returns the bytes start..end inclusive
+        size (int): the file size in bytes
+        head_size (int): the number of leading bytes to fetch first
+
+    Returns:
+        tuple[int, int]: (width, height), or None if it could not be read from the metadata
+    """
+    if not size:
+        return None
+    head = read_range(0, min(head_size, size) - 1)
+
+    if head[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip'):
+        moov = _find_moov(read_range, head, size)
+        if moov is not None:
+            return _moov_resolution(moov)
+
+    media_info = MediaInfo.parse(io.BytesIO(head))
+    for track in media_info.video_tracks:
+        if track.width and track.height:
+            return (track.width, track.height)
+    return None
+
+
+def _box_header(data: bytes, offset: int = 0) -> tuple[int, bytes, int]:
+    # Returns (box size, box type, header size) for the box starting at `offset`
+    box_size, box_type = struct.unpack_from('>I4s', data, offset)
+    if box_size == 1:
+        return struct.unpack_from('>Q', data, offset + 8)[0], box_type, 16
+    return box_size, box_type, 8
+
+
+def _find_moov(read_range: Callable[[int, int], bytes], head: bytes, size: int) -> bytes:
+    offset = 0
+    while offset + 8 <= size:
+        header = head[offset:offset + 16] if offset + 16 <= len(head) else read_range(offset, min(offset + 16, size) - 1)
+        box_size, box_type, _ = _box_header(header)
+        if box_size == 0:
+            box_size = size - offset
+        if box_size < 8:
+            return None
+        if box_type == b'moov':
+            if box_size > MAX_MOOV_SIZE:
+                return None
+            if offset + box_size <= len(head):
+                return head[offset:offset + box_size]
+            return read_range(offset, offset + box_size - 1)
+        offset += box_size
+    return None
+
+
+def _children(data: bytes, start: int, end: int):
+    offset = start
+    while offset + 8 <= end:
+        box_size, box_type, header_size = _box_header(data, offset)
+        if box_size == 0:
+            box_size = end - offset
+        if box_size < header_size:
+            return
+        yield box_type, offset + header_size, min(offset + box_size, end)
+        offset += box_size
+
+
+def _moov_resolution(moov: bytes) -> tuple[int, int]:
+    # The visual sample entry in a video track's stsd holds the coded size; tkhd holds the display size
+    fallback = None
+    _, _, header_size = _box_header(moov)
+    for box_type, start, end in _children(moov, header_size, len(moov)):
+        if box_type != b'trak':
+            continue
+        handler, coded, display = None, None, None
+        stack = [(b'trak', start, end)]
+        while stack:
+            parent_type, parent_start, parent_end = stack.pop()
+            for child_type, child_start, child_end in _children(moov, parent_start, parent_end):
+                if child_type in CONTAINER_BOXES:
+                    stack.append((child_type, child_start, child_end))
+                elif child_type == b'tkhd' and child_end - child_start >= 8:
+                    width, height = struct.unpack_from('>II', moov, child_end - 8)
+                    display = (width >> 16, height >> 16)
+                # QuickTime files also have a data handler ('alis') in minf; only mdia's hdlr names the track type
+                elif child_type == b'hdlr' and parent_type == b'mdia' and child_end - child_start >= 12:
+                    handler = moov[child_start + 8:child_start + 12]
+                elif child_type == b'stsd' and child_end - child_start >= 8 + 8 + 36:
+                    # stsd: version/flags, entry count, then the first sample entry's box header and fields
+                    entry = child_start + 8 + 8
+                    coded = struct.unpack_from('>HH', moov, entry + 24)
+        if handler == b'vide':
+            for resolution in (coded, display):
+                if resolution and all(resolution):
+                    return resolution
+        elif display and all(display) and fallback is None:
+            fallback = display
+    return fallback
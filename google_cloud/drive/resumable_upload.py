@@ -0,0 +1,196 @@
+import json
+import os
+from hashlib import sha256
+from random import random
+from time import sleep
+from typing import Callable
+
+import requests
+import urllib3
+
+from .content_cache import CACHE_DIR
+
+DRIVE_UPLOAD_URL = 'https://www.googleapis.com/upload/drive/v3/files'
+# Every chunk except the last must be a multiple of 256 KiB
+UPLOAD_CHUNK_GRANULARITY = 256 * 1024
+# Session URIs of unfinished uploads, so a later process can continue them (Drive keeps a session for a week)
+UPLOAD_SESSION_DIR = os.path.join(CACHE_DIR, 'upload_sessions')
+
+
+class ResumableUpload():
+    """
+    One Drive resumable upload session, fed with bytes as they become available.
+
+    Data passed to `write` is buffered and sent in `chunk_size` pieces by `flush`; `finish` sends the rest and returns
+    the created file. Bytes are only dropped from the buffer once Drive confirms them, so a dropped connection (or a
+    chunk that Drive only partly committed) is resent from the buffer without re-reading the source. With a
+    `session_key`, the session URI is persisted and `begin` continues an earlier, interrupted upload.
+    """
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, session: requests.Session, metadata: dict, mime_type: str, size: int = None,
+                 chunk_size: int = 8 * 1024 * 1024, session_key: str = None, fields: str = 'id',
+                 progress_callback: Callable[[int, int], None] = None, max_retries: int = 5):
+        self.session = session
+        self.metadata = metadata
+        self.mime_type = mime_type
+        self.size = size
+        self.chunk_size = max(1, -(-chunk_size // UPLOAD_CHUNK_GRANULARITY)) * UPLOAD_CHUNK_GRANULARITY
+        self.session_key = session_key
+        self.fields = fields
+        self.progress_callback = progress_callback
+        self.max_retries = max_retries
+
+        self.session_uri: str = None
+        self.result: dict = None
+        self._buffer = bytearray()
+        self._buffer_start = 0
+
+    @property
+    def offset(self) -> int:
+        """The number of bytes Drive has committed"""
+        return self._buffer_start
+
+    @property
+    def ready(self) -> bool:
+        """Whether enough data is buffered for flush to send a chunk"""
+        return len(self._buffer) > self.chunk_size
+
+    @property
+    def session_path(self) -> str:
+        if self.session_key:
+            return os.path.join(UPLOAD_SESSION_DIR, sha256(self.session_key.encode('utf-8')).hexdigest() + '.json')
+
+    def begin(self) -> int:
+        """
+        Continues the persisted session for `session_key` if Drive still has it, otherwise starts a new one
+
+        Returns:
+            int: the offset to read the source from, i.e. the number of bytes Drive already has
+        """
+        if self.session_path and os.path.exists(self.session_path):
+            with open(self.session_path, 'r') as f:
+                saved = json.load(f)
+            if saved.get('size') == self.size:
+                self.session_uri = saved['session_uri']
+                if self._query():
+                    print(f'Resuming upload of {self.metadata.get("name")} at byte {self.offset}')
+                    return self.offset
+        self._start()
+        return 0
+
+    def write(self, data: bytes):
+        self._buffer += data
+
+    def flush(self, final: bool = False):
+        """
+        Sends every full chunk in the buffer, or everything if `final`
+        """
+        attempt = 0
+        while self.result is None and (final or self.ready):
+            length = len(self._buffer) if final else self.chunk_size
+            total = self._buffer_start + len(self._buffer) if final else self.size
+            if length:
+                content_range = f'bytes {self._buffer_start}-{self._buffer_start + length - 1}/{"*" if total is None else total}'
+            else:
+                content_range = f'bytes */{total}'
+            try:
+                response = self.session.put(
+                    self.session_uri, data=bytes(self._buffer[:length]),
+                    headers={'Content-Range': content_range}, timeout=(30, 300)
+                )
+                if response.status_code in self.RETRY_STATUS_CODES:
+                    response.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError, urllib3.exceptions.HTTPError) as error:
+                attempt += 1
+                self._backoff(attempt, error)
+                if not self._query():
+                    raise ConnectionError(f'The upload session for {self.metadata.get("name")} expired') from error
+                continue
+            attempt = 0
+            self._handle(response)
+
+    def finish(self) -> dict:
+        """
+        Sends the rest of the buffer as the last chunk
+
+        Returns:
+            dict: the created file, with the requested fields
+        """
+        self.flush(final=True)
+        return self.result
+
+    def _start(self):
+        headers = {'X-Upload-Content-Type': self.mime_type}
+        if self.size is not None:
+            headers['X-Upload-Content-Length'] = str(self.size)
+        params = {'uploadType': 'resumable', 'supportsAllDrives': 'true', 'fields': self.fields}
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(DRIVE_UPLOAD_URL, params=params, json=self.metadata, headers=headers, timeout=(30, 60))
+                response.raise_for_status()
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as error:
+                if isinstance(error, requests.HTTPError) and error.response.status_code not in self.RETRY_STATUS_CODES:
+                    raise error
+                attempt += 1
+                self._backoff(attempt, error)
+
+        self.session_uri = response.headers['Location']
+        self._buffer_start = 0
+        if self.session_path:
+            os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+            temp_path = f'{self.session_path}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump({'session_uri': self.session_uri, 'size': self.size}, f)
+            os.replace(temp_path, self.session_path)
+
+    def _query(self) -> bool:
+        # Asks Drive how much of the upload it has. Returns False if the session no longer exists.
+        attempt = 0
+        while True:
+            try:
+                response = self.session.put(
+                    self.session_uri, headers={'Content-Range': f'bytes */{"*" if self.size is None else self.size}'},
+                    timeout=(30, 60)
+                )
+            except (requests.ConnectionError, requests.Timeout) as error:
+                attempt += 1
+                self._backoff(attempt, error)
+                continue
+            if response.status_code in (404, 410):
+                return False
+            if response.status_code in self.RETRY_STATUS_CODES:
+                attempt += 1
+                self._backoff(attempt, response.status_code)
+                continue
+            self._handle(response)
+            return True
+
+    def _handle(self, response: requests.Response):
+        if response.status_code in (200, 201):
+            self.result = response.json()
+            self._buffer_start += len(self._buffer)
+            self._buffer.clear()
+            if self.session_path and os.path.exists(self.session_path):
+                os.remove(self.session_path)
+        elif response.status_code == 308:
+            # Range is 'bytes=0-<last committed byte>', and absent when nothing has been committed yet
+            committed = int(response.headers['Range'].rsplit('-', 1)[1]) + 1 if response.headers.get('Range') else 0
+            if committed > self._buffer_start:
+                del self._buffer[:committed - self._buffer_start]
+                self._buffer_start = committed
+        else:
+            response.raise_for_status()
+
+        if self.progress_callback:
+            self.progress_callback(self._buffer_start, self.size)
+
+    def _backoff(self, attempt: int, error):
+        if attempt > self.max_retries:
+            raise error if isinstance(error, Exception) else ConnectionError(f'Upload failed with status {error}')
+        delay = min(64, 2 ** attempt) * (0.5 + random() / 2)
+        print(f'Upload of {self.metadata.get("name")} interrupted at byte {self._buffer_start} ({error}), retrying in {delay:.1f} seconds')
+        sleep(delay)
@@ -0,0 +1,136 @@
+import json
+import threading
+from threading import Lock
+
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import Resource, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import build_http
+
+
+class ThreadLocalHttp():
+    """
+    An Http stand-in for discovery Resources that hands each thread its own AuthorizedHttp,
+    since httplib2 connections must not be shared across threads
+    """
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self._local = threading.local()
+
+    @property
+    def http(self) -> AuthorizedHttp:
+        if not hasattr(self._local, 'http'):
+            # build_http() sets the same socket timeout and redirect handling as every googleapiclient client
+            self._local.http = AuthorizedHttp(self.credentials, http=build_http())
+        return self._local.http
+
+    def request(self, *args, **kwargs):
+        return self.http.request(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+def credentials_key(credentials) -> tuple:
+    """
+    Gets a stable identity for credentials, so equal credentials built separately share clients. Returns None for
+    credentials that are not a service account's, which are then not shared.
+    """
+    email = getattr(credentials, 'service_account_email', None)
+    if not email:
+        return None
+    scopes = getattr(credentials, 'scopes', None) or getattr(credentials, 'default_scopes', None) or ()
+    return (email, tuple(sorted(scopes)), getattr(credentials, '_subject', None))
+
+
+class ServiceRegistry():
+    """
+    Process-wide cache of service account secrets, credentials, parsed discovery documents and built API clients.
+
+    Every GoogleWorkspaceService (and the legacy GoogleDriveFile) shares one Resource per (API, version, service
+    account, scopes), built from the discovery documents shipped with google-api-python-client, so only the first use pays for the
+    secret lookup, the JSON parsing and the client construction.
+    """
+    def __init__(self):
+        self._secrets: dict[tuple, dict] = {}
+        self._credentials: dict[tuple, service_account.Credentials] = {}
+        self._documents: dict[tuple, dict] = {}
+        self._services: dict[tuple, Resource] = {}
+        self._http: dict[tuple, ThreadLocalHttp] = {}
+        self._sessions = threading.local()
+        self._lock = Lock()
+
+    def secret(self, gc, secret_id: str) -> dict:
+        key = (gc.project_id, secret_id)
+        with self._lock:
+            if key not in self._secrets:
+                self._secrets[key] = gc.get_secret(secret_id)
+            return self._secrets[key]
+
+    def credentials(self, info: dict, scopes: list[str]) -> service_account.Credentials:
+        """
+        Gets the credentials for a service account, parsing its JSON key only once per set of scopes
+        """
+        key = (info.get('client_email'), info.get('private_key_id'), tuple(sorted(scopes)))
+        with self._lock:
+            if key not in self._credentials:
+                self._credentials[key] = service_account.Credentials.from_service_account_info(info, scopes=scopes)
+            return self._credentials[key]
+
+    def discovery_document(self, name: str, version: str) -> dict:
+        key = (name, version)
+        with self._lock:
+            if key not in self._documents:
+                document = get_static_doc(name, version)
+                if document is None:
+                    raise ValueError(f'No static discovery document for {name} {version}')
+                self._documents[key] = json.loads(document)
+            return self._documents[key]
+
+    def http(self, credentials) -> ThreadLocalHttp:
+        key = credentials_key(credentials)
+        if key is None:
+            return ThreadLocalHttp(credentials)
+        with self._lock:
+            if key not in self._http:
+                self._http[key] = ThreadLocalHttp(credentials)
+            return self._http[key]
+
+    def session(self, credentials) -> AuthorizedSession:
+        # requests sessions are not thread-safe either, so sessions are kept per thread as well
+        key = credentials_key(credentials)
+        if key is None:
+            return AuthorizedSession(credentials)
+        sessions = self._sessions.__dict__.setdefault('sessions', {})
+        if key not in sessions:
+            sessions[key] = AuthorizedSession(credentials)
+        return sessions[key]
+
+    def service(self, name: str, version: str, credentials) -> Resource:
+        """
+        Gets a shared API client. Its requests run on a per-thread AuthorizedHttp, so it can be used from any thread.
+
+        Args:
+            name (str): the API name, e.g. 'drive'
+            version (str): the API version, e.g. 'v3'
+            credentials: the credentials to authorize requests with
+
+        Returns:
+            Resource: the API client
+        """
+        document = self.discovery_document(name, version)
+        http = self.http(credentials)
+        key = credentials_key(credentials)
+        if key is None:
+            return build_from_document(document, http=http)
+        key = (name, version) + key
+        with self._lock:
+            if key not in self._services:
+                self._services[key] = build_from_document(document, http=http)
+            return self._services[key]
+
+
+# One registry per process, so short-lived service objects reuse the clients built before them
+service_registry = ServiceRegistry()
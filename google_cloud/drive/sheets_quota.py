@@ -0,0 +1,131 @@
+import re
+from random import random
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any
+
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+from requests import Response
+
+
+class TokenBucket():
+    """
+    Paces calls to a per-minute quota. Holds up to `capacity` tokens and refills at `per_minute` tokens a minute.
+    """
+    def __init__(self, per_minute: int, capacity: int = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity or per_minute
+        self._tokens = float(self.capacity)
+        self._updated = monotonic()
+        self._lock = Lock()
+
+    def acquire(self) -> float:
+        """
+        Blocks until a token is available
+
+        Returns:
+            float: the number of seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            sleep(wait)
+            waited += wait
+
+
+class SheetsQuotaManager():
+    """
+    Shared pacing and retry policy for Sheets API calls.
+
+    Reads and writes each get a token bucket sized to the Sheets per-minute, per-user quotas. Failed calls with a
+    retryable status (429, 408, 5xx) are retried with jittered exponential backoff, honouring Retry-After.
+    Requests, retries and time spent throttled are counted per spreadsheet.
+    """
+    RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+    SPREADSHEET_ID_PATTERN = re.compile(r'/spreadsheets/([a-zA-Z0-9_-]+)')
+
+    def __init__(self, reads_per_minute: int = 60, writes_per_minute: int = 60, max_retries: int = 6,
+                 base_backoff: float = 1.0, max_backoff: float = 64.0):
+        self.read_bucket = TokenBucket(reads_per_minute)
+        self.write_bucket = TokenBucket(writes_per_minute)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.counters: dict[str, dict] = {}
+        self._counters_lock = Lock()
+
+    def spreadsheet_id(self, endpoint: str) -> str:
+        match = self.SPREADSHEET_ID_PATTERN.search(endpoint or '')
+        return match.group(1) if match else None
+
+    def _count(self, spreadsheet_id: str, key: str, amount: float = 1):
+        with self._counters_lock:
+            counters = self.counters.setdefault(spreadsheet_id, {'requests': 0, 'retries': 0, 'throttled_seconds': 0.0})
+            counters[key] += amount
+
+    def usage(self, spreadsheet_id: str) -> dict:
+        with self._counters_lock:
+            return dict(self.counters.get(spreadsheet_id, {'requests': 0, 'retries': 0, 'throttled_seconds': 0.0}))
+
+    def backoff(self, attempt: int, response: Response = None) -> float:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        delay = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        # Equal jitter: spread the retries of concurrent callers without dropping below half the delay
+        return delay / 2 + random() * delay / 2
+
+    def call(self, method: str, endpoint: str, send) -> Response:
+        """
+        Runs a request through the quota buckets and the retry policy
+
+        Args:
+            method (str): the HTTP method, used to pick the read or write bucket
+            endpoint (str): the request URL, used to attribute the call to a spreadsheet
+            send (callable): sends the request once and returns the response or raises APIError
+
+        Returns:
+            Response: the response of the first successful attempt
+        """
+        spreadsheet_id = self.spreadsheet_id(endpoint)
+        bucket = self.read_bucket if method.upper() == 'GET' else self.write_bucket
+
+        for attempt in range(self.max_retries + 1):
+            self._count(spreadsheet_id, 'throttled_seconds', bucket.acquire())
+            self._count(spreadsheet_id, 'requests')
+            try:
+                return send()
+            except APIError as e:
+                if e.response.status_code not in self.RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise e
+                delay = self.backoff(attempt, e.response)
+                print(f'Sheets API returned {e.response.status_code}, retrying in {delay:.1f} seconds')
+                self._count(spreadsheet_id, 'retries')
+                self._count(spreadsheet_id, 'throttled_seconds', delay)
+                sleep(delay)
+
+
+# One manager per process, so every GoogleSheet shares the same per-user quota
+quota_manager = SheetsQuotaManager()
+
+
+class QuotaHTTPClient(HTTPClient):
+    """
+    gspread HTTP client that sends every request through the shared SheetsQuotaManager
+    """
+    quota_manager: SheetsQuotaManager = quota_manager
+
+    def request(self, method: str, endpoint: str, *args: Any, **kwargs: Any) -> Response:
+        return self.quota_manager.call(
+            method,
+            endpoint,
+            lambda: super(QuotaHTTPClient, self).request(method, endpoint, *args, **kwargs)
+        )
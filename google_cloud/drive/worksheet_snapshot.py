@@ -0,0 +1,211 @@
+import numpy as np
+
+
+class WorksheetSnapshot:
+    """
+    A columnar, read-only copy of a worksheet. Each column is a single typed NumPy array
+    instead of one dict per row (records) or per cell (indexed_values).
+    """
+    AGGREGATIONS = {
+        'sum': np.nansum,
+        'mean': np.nanmean,
+        'min': np.nanmin,
+        'max': np.nanmax,
+        'count': lambda column: int(np.count_nonzero(~_missing(column))),
+    }
+
+    def __init__(self, headers: list[str], columns: dict[str, np.ndarray]):
+        self.headers = headers
+        self.columns = columns
+
+    @classmethod
+    def from_values(cls, values: list[list]) -> 'WorksheetSnapshot':
+        """
+        Builds a snapshot from a worksheet grid where the first row is the header. Repeated header names are made
+        unique the way pandas does it: 'Name', 'Name.1', 'Name.2'
+
+        Args:
+            values (list[list]): the worksheet values, e.g. GoogleSheetWorksheet.values
+
+        Returns:
+            WorksheetSnapshot: the snapshot
+        """
+        if not values:
+            return cls(headers=[], columns={})
+
+        headers = _unique_headers(values[0])
+        width = len(headers)
+        rows = [(row + [''] * (width - len(row)))[:width] for row in values[1:]]
+        raw_columns = zip(*rows) if rows else [()] * width
+        columns = {header: _typed_column(raw) for header, raw in zip(headers, raw_columns)}
+        return cls(headers=headers, columns=columns)
+
+    def __len__(self) -> int:
+        return len(self.columns[self.headers[0]]) if self.headers else 0
+
+    def __repr__(self):
+        return f'WorksheetSnapshot(rows={len(self)}, columns={self.headers})'
+
+    @property
+    def dtypes(self) -> dict[str, np.dtype]:
+        return {header: column.dtype for header, column in self.columns.items()}
+
+    def column(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def to_pandas(self):
+        import pandas as pd
+        return pd.DataFrame(self.columns, columns=self.headers, copy=False)
+
+    def to_arrow(self):
+        import pyarrow as pa
+        return pa.table({header: pa.array(column, from_pandas=True) for header, column in self.columns.items()})
+
+    def to_records(self) -> list[dict]:
+        return [dict(zip(self.headers, row)) for row in zip(*(self.columns[header].tolist() for header in self.headers))]
+
+    def take(self, mask_or_indices: np.ndarray) -> 'WorksheetSnapshot':
+        """
+        Selects rows with a boolean mask or an array of row positions
+        """
+        return WorksheetSnapshot(
+            headers=self.headers,
+            columns={header: column[mask_or_indices] for header, column in self.columns.items()}
+        )
+
+    def filter(self, **equals) -> 'WorksheetSnapshot':
+        """
+        Selects the rows where every given column equals the given value, e.g. snapshot.filter(Status='Open')
+
+        Returns:
+            WorksheetSnapshot: the matching rows
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in equals.items():
+            mask &= self.columns[name] == value
+        return self.take(mask)
+
+    def where(self, name: str, op: str, value) -> 'WorksheetSnapshot':
+        """
+        Selects the rows where `column op value` holds
+
+        Args:
+            name (str): the column name
+            op (str): one of '==', '!=', '<', '<=', '>', '>=', 'contains'
+            value: the value to compare against
+
+        Returns:
+            WorksheetSnapshot: the matching rows
+        """
+        column = self.columns[name]
+        if op == 'contains':
+            text = str(value)
+            mask = np.fromiter((text in str(cell) for cell in column.tolist()), dtype=bool, count=len(column))
+        else:
+            mask = {
+                '==': np.equal,
+                '!=': np.not_equal,
+                '<': np.less,
+                '<=': np.less_equal,
+                '>': np.greater,
+                '>=': np.greater_equal,
+            }[op](column, value)
+        return self.take(mask)
+
+    def aggregate(self, name: str, func: str = 'sum'):
+        """
+        Aggregates a column
+
+        Args:
+            name (str): the column name
+            func (str): one of 'sum', 'mean', 'min', 'max', 'count'
+
+        Returns:
+            the aggregated value
+        """
+        result = self.AGGREGATIONS[func](self.columns[name])
+        return result.item() if isinstance(result, np.generic) else result
+
+    def group_by(self, key: str, name: str, func: str = 'sum') -> dict:
+        """
+        Aggregates a column for each distinct value of a key column
+
+        Args:
+            key (str): the column to group by
+            name (str): the column to aggregate
+            func (str): one of 'sum', 'mean', 'min', 'max', 'count'
+
+        Returns:
+            dict: {key value: aggregated value}
+        """
+        key_column = self.columns[key]
+        keys, inverse = np.unique(key_column if key_column.dtype == object else key_column.astype(str), return_inverse=True)
+        if not len(keys):
+            return {}
+        inverse = inverse.reshape(-1)
+        column = self.columns[name]
+        numeric = column.dtype.kind in 'iufb'
+        if func in ('sum', 'mean') and not numeric:
+            raise TypeError(f"Cannot {func} the text column '{name}'")
+
+        present = ~_missing(column)
+        counts = np.bincount(inverse, weights=present, minlength=len(keys)).astype(np.int64)
+        # Sort the rows by group once; each group is then a contiguous run starting at `starts`
+        order = np.lexsort((column, inverse)) if func in ('min', 'max') and not numeric else np.argsort(inverse, kind='stable')
+        sizes = np.bincount(inverse, minlength=len(keys))
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+        if func == 'count':
+            values = counts
+        elif func in ('sum', 'mean'):
+            sums = np.add.reduceat(np.where(present, column, 0)[order], starts)
+            if func == 'sum':
+                values = sums
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    values = sums / counts
+        elif numeric:
+            values = (np.fmin if func == 'min' else np.fmax).reduceat(column[order], starts)
+        else:
+            values = column[order][starts if func == 'min' else starts + sizes - 1]
+        return {str(value): result for value, result in zip(keys, values.tolist())}
+
+
+def _unique_headers(headers: list) -> list[str]:
+    # Renames repeated headers to 'Name.1', 'Name.2', ... so no column is overwritten
+    seen: dict[str, int] = {}
+    unique = []
+    for header in headers:
+        header = str(header)
+        name = header
+        while name in seen:
+            seen[header] += 1
+            name = f'{header}.{seen[header]}'
+        seen.setdefault(name, 0)
+        unique.append(name)
+    return unique
+
+
+def _missing(column: np.ndarray) -> np.ndarray:
+    if column.dtype.kind == 'f':
+        return np.isnan(column)
+    if column.dtype.kind in 'iub':
+        return np.zeros(len(column), dtype=bool)
+    return column == ''
+
+
+def _typed_column(raw: tuple) -> np.ndarray:
+    # Numeric columns become int64/float64 (blanks as NaN). Everything else stays an object array of the original
+    # strings; a '<U{n}' array would pad every cell to the longest one in the column
+    column = np.empty(len(raw), dtype=object)
+    column[:] = raw
+    blank = np.fromiter((not str(cell).strip() for cell in raw), dtype=bool, count=len(raw))
+    if blank.all():
+        return column
+    try:
+        numbers = np.where(blank, 'nan', column).astype(np.float64)
+    except ValueError:
+        return column
+    if not blank.any() and np.all(np.mod(numbers, 1) == 0) and np.all(np.abs(numbers) < 2 ** 53):
+        return numbers.astype(np.int64)
+    return numbers